@@ -0,0 +1,728 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+import aiohttp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+import main as bot
+from main import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_REFRESH, logger, metrics
+from poll_state import PollState
+
+# Event-loop runtime for the poll bot. Polls, storage, tallies and message rendering are the ones in main.py;
+# only the Slack I/O, the scheduler and the handlers are replaced with coroutines, so one loop serves every
+# poll and event and all Web API calls share one pool of keep-alive connections.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_KEEPALIVE_SECONDS = 60
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", 256))
+
+# The session is attached in start_runtime(), once there is a running loop to bind it to
+client = AsyncWebClient(token=os.getenv("SLACK_BOT_TOKEN"), base_url=os.getenv("SLACK_API_URL") or AsyncWebClient.BASE_URL)
+app = AsyncApp(client=client)
+
+background_tasks = set()
+
+
+def spawn(coro):
+    # The loop only keeps weak references to tasks, so hold on to them until they finish
+    task = asyncio.get_running_loop().create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+class AsyncSlackRateLimiter:
+    # main.SlackRateLimiter's per-method token buckets and priority order, awaited instead of blocking a thread.
+    # At most max_in_flight calls hold a connection at once; the rest wait here rather than in aiohttp.
+    def __init__(self, max_in_flight=HTTP_POOL_SIZE):
+        self.buckets = {}
+        self.counter = itertools.count()
+        self.cond = asyncio.Condition()
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.throttled = 0
+        self.workers = 1
+
+    def _bucket(self, method):
+        bucket = self.buckets.get(method)
+        if bucket is None:
+            bucket = self.buckets[method] = bot.make_bucket(method, self.workers)
+        return bucket
+
+    async def set_workers(self, workers):
+        async with self.cond:
+            if workers == self.workers:
+                return
+            self.workers = workers
+            for bucket in self.buckets.values():
+                bucket.resize(workers)
+            self.cond.notify_all()
+
+    async def acquire(self, method, priority):
+        async with self.cond:
+            bucket = self._bucket(method)
+            entry = (priority, next(self.counter))
+            heapq.heappush(bucket.waiters, entry)
+            try:
+                while True:
+                    delay = bucket.delay(time.monotonic())
+                    if bucket.waiters[0] == entry and delay <= 0:
+                        heapq.heappop(bucket.waiters)
+                        bucket.tokens -= 1
+                        self.cond.notify_all()
+                        return
+                    try:
+                        await asyncio.wait_for(self.cond.wait(), delay if bucket.waiters[0] == entry else None)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                # A cancelled caller must not stay at the head of the queue
+                bucket.waiters.remove(entry)
+                heapq.heapify(bucket.waiters)
+                self.cond.notify_all()
+                raise
+
+    async def release(self, method):
+        async with self.cond:
+            bucket = self._bucket(method)
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+            self.cond.notify_all()
+
+    def rate(self, method):
+        return self._bucket(method).rate
+
+    async def block(self, method, retry_after):
+        async with self.cond:
+            bucket = self._bucket(method)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            self.throttled += 1
+            self.cond.notify_all()
+
+    async def call(self, method, priority=PRIORITY_NORMAL, render=None, **kwargs):
+        # render works as in main.SlackRateLimiter.call: arguments are built once the token is held
+        for attempt in range(bot.MAX_RATE_LIMIT_RETRIES + 1):
+            wait_start = time.perf_counter()
+            await self.acquire(method, priority)
+            if render is not None:
+                kwargs = render()
+                if kwargs is None:
+                    await self.release(method)
+                    return None
+            async with self.in_flight:
+                start = time.perf_counter()
+                metrics.observe("slack_rate_limit_wait_seconds", start - wait_start, method=method)
+                try:
+                    response = await getattr(app.client, method)(**kwargs)
+                    metrics.inc("slack_api_calls_total", method=method, result="ok")
+                    return response
+                except SlackApiError as e:
+                    rate_limited = e.response.status_code == 429
+                    metrics.inc("slack_api_calls_total", method=method, result="ratelimited" if rate_limited else "error")
+                    if not rate_limited or attempt == bot.MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    retry_after = bot.retry_after_seconds(e.response)
+                    logger.info(f"Rate limited on {method}, retrying in {retry_after}s")
+                except Exception:
+                    metrics.inc("slack_api_calls_total", method=method, result="error")
+                    raise
+                finally:
+                    metrics.observe("slack_api_call_seconds", time.perf_counter() - start, method=method)
+            await self.block(method, retry_after)
+
+
+rate_limiter = AsyncSlackRateLimiter()
+
+
+async def slack_call(method, priority=PRIORITY_NORMAL, render=None, **kwargs):
+    return await rate_limiter.call(method, priority, render, **kwargs)
+
+
+class AsyncPollScheduler:
+    # main.PollScheduler on the event loop: the same generation-stamped deadline heap, but each due job runs as
+    # its own task (at most max_concurrent_jobs at once) under a per-poll lock, so one poll's jobs never overlap
+    # while a slow poll no longer holds up the rest.
+    def __init__(self, max_concurrent_jobs=MAX_CONCURRENT_JOBS):
+        self.heap = []
+        self.generations = {}
+        self.counter = itertools.count()
+        self.locks = {}
+        self.wakeup = asyncio.Event()
+        self.slots = asyncio.Semaphore(max_concurrent_jobs)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = spawn(self._run())
+
+    def add_polls(self, entries):
+        now = time.time()
+        for poll_id, start_time, duration, first_run in entries:
+            first_run = first_run or now
+            generation = self.generations[poll_id] = next(self.counter)
+            jobs = [(first_run, refresh_poll)]
+            if bot.RECONCILE_MODE == "poll":
+                jobs.append((first_run + bot.RECONCILE_INTERVAL, reconcile_poll))
+            if duration > 0:
+                jobs.append((max(start_time + duration * 3600, first_run), expire_poll))
+            for deadline, job in jobs:
+                heapq.heappush(self.heap, (deadline, next(self.counter), poll_id, generation, job))
+        self.wakeup.set()
+
+    def add_job(self, key, deadline, job):
+        self.generations[key] = next(self.counter)
+        self.schedule(key, deadline, job)
+
+    def schedule(self, poll_id, deadline, job):
+        generation = self.generations.get(poll_id)
+        if generation is None:
+            return False
+        heapq.heappush(self.heap, (deadline, next(self.counter), poll_id, generation, job))
+        self.wakeup.set()
+        return True
+
+    def cancel(self, poll_id):
+        return self.generations.pop(poll_id, None) is not None
+
+    def is_scheduled(self, poll_id):
+        return poll_id in self.generations
+
+    async def _run(self):
+        while True:
+            while not self.heap or self.heap[0][0] > time.time():
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.heap[0][0] - time.time() if self.heap else None)
+                except asyncio.TimeoutError:
+                    pass
+            deadline, _, poll_id, generation, job = heapq.heappop(self.heap)
+            if self.generations.get(poll_id) != generation:
+                continue
+            await self.slots.acquire()
+            spawn(self._run_job(poll_id, job))
+
+    async def run_exclusive(self, poll_id, job, *args):
+        # Runs job(poll_id, *args) right away but like a scheduled job: within the job limit and under the poll's lock
+        async with self.slots:
+            async with self.locks.setdefault(poll_id, asyncio.Lock()):
+                await job(poll_id, *args)
+
+    async def _run_job(self, poll_id, job):
+        try:
+            async with self.locks.setdefault(poll_id, asyncio.Lock()):
+                if not self.is_scheduled(poll_id):
+                    return
+                try:
+                    await job(poll_id)
+                except Exception as e:
+                    logger.info(f"Scheduled job {job.__name__} failed: {e}", extra={'poll_id': poll_id})
+        finally:
+            self.slots.release()
+            if poll_id not in self.generations:
+                self.locks.pop(poll_id, None)
+
+
+scheduler = AsyncPollScheduler()
+
+
+async def flush_poll_update(poll_id):
+    update_coalescer.flush(poll_id)
+
+
+class AsyncUpdateSender:
+    # main.PollUpdateSender on the loop: one update task per poll at a time, run through the scheduler so it
+    # counts against MAX_CONCURRENT_JOBS and never overlaps the poll's other jobs. Requests arriving meanwhile
+    # fold into one more send once it finishes.
+    def __init__(self, send):
+        self.send = send
+        self.in_flight = set()
+        self.dirty = {}
+
+    def submit(self, poll_id, priority=PRIORITY_NORMAL):
+        if poll_id in self.in_flight:
+            self.dirty[poll_id] = min(self.dirty.get(poll_id, priority), priority)
+            return
+        self.in_flight.add(poll_id)
+        spawn(self._run(poll_id, priority))
+
+    async def _run(self, poll_id, priority):
+        try:
+            while priority is not None:
+                try:
+                    await scheduler.run_exclusive(poll_id, self.send, priority)
+                except Exception as e:
+                    logger.info(f"Poll update failed: {e}", extra={'poll_id': poll_id})
+                priority = self.dirty.pop(poll_id, None)
+        finally:
+            self.in_flight.discard(poll_id)
+
+
+update_coalescer = bot.UpdateCoalescer(
+    lambda poll_id, priority: update_sender.submit(poll_id, priority),
+    lambda poll_id, deadline: scheduler.schedule(poll_id, deadline, flush_poll_update),
+    budget=lambda: rate_limiter.rate('chat_update')
+)
+
+
+async def send_poll_update(poll_id, priority=PRIORITY_NORMAL):
+    poll = bot.polls.get(poll_id, None)
+    if poll:
+        await update_poll_results(poll, priority)
+
+
+update_sender = AsyncUpdateSender(send_poll_update)
+
+
+@metrics.timed("poll_process_seconds")
+async def fetch_poll_reactions(poll, priority=PRIORITY_NORMAL):
+    try:
+        reaction = await slack_call(
+            'reactions_get',
+            priority,
+            channel=poll.channel_id,
+            timestamp=poll.timestamp,
+            full=True
+        )
+    except Exception as e:
+        logger.info(f"Error fetching reactions: {e}", extra={'poll_id': poll.poll_id})
+        if poll.tally is None:
+            return None
+        return poll.tally.results(poll.max_mentions)
+
+    return bot.apply_message_reactions(poll, reaction['message'].get('reactions', []))
+
+
+@metrics.timed("poll_update_seconds")
+async def update_poll_results(poll, priority=PRIORITY_NORMAL):
+    if poll.tally is None:
+        poll_results = await fetch_poll_reactions(poll, priority)
+        if poll_results is None:
+            return
+    else:
+        poll_results = poll.tally.results(poll.max_mentions)
+
+    if bot.needs_voter_list(poll, poll_results):
+        await sync_voter_list(poll, priority)
+    if bot.render_cache.unchanged(poll.poll_id, bot.build_poll_message(poll, poll_results)):
+        return
+
+    sent = []
+
+    def render():
+        # Rendered once the token is held, as in main.update_poll_results
+        if bot.polls.get(poll.poll_id, None) is not poll:
+            return None
+        text = bot.build_poll_message(poll, poll.tally.results(poll.max_mentions) if poll.tally else poll_results)
+        if bot.render_cache.unchanged(poll.poll_id, text):
+            return None
+        sent.append(text)
+        return {'channel': poll.channel_id, 'ts': poll.timestamp, 'text': text}
+
+    try:
+        await slack_call('chat_update', priority, render=render)
+    except Exception as e:
+        logger.info(f"Failed to update message: {e}", extra={'poll_id': poll.poll_id})
+        return
+    if sent:
+        bot.render_cache.remember(poll.poll_id, sent[-1])
+
+
+async def sync_voter_list(poll, priority=PRIORITY_NORMAL):
+    if poll.tally is None:
+        return
+    text = bot.build_voter_list(poll, poll.tally.named(poll.max_mentions))
+    if bot.voter_list_cache.unchanged(poll.poll_id, text):
+        return
+    try:
+        if poll.voters_ts is None:
+            response = await slack_call('chat_postMessage', priority, channel=poll.channel_id,
+                                        thread_ts=poll.timestamp, text=text)
+            poll.voters_ts = response['ts']
+            link = await slack_call('chat_getPermalink', priority, channel=poll.channel_id, message_ts=poll.voters_ts)
+            poll.voters_link = link['permalink']
+            await asyncio.to_thread(bot.poll_store.update_poll, poll)
+        else:
+            await slack_call('chat_update', priority, channel=poll.channel_id, ts=poll.voters_ts, text=text)
+    except Exception as e:
+        logger.info(f"Failed to update voter list: {e}", extra={'poll_id': poll.poll_id})
+        return
+    bot.voter_list_cache.remember(poll.poll_id, text)
+
+
+async def refresh_poll(poll_id):
+    poll = bot.polls.get(poll_id, None)
+    if not poll:
+        scheduler.cancel(poll_id)
+        return
+
+    update_coalescer.request(poll_id, PRIORITY_REFRESH)
+    next_refresh = bot.next_countdown_refresh(poll)
+    if next_refresh is not None:
+        scheduler.schedule(poll_id, next_refresh, refresh_poll)
+
+
+async def reconcile_poll(poll_id):
+    poll = bot.polls.get(poll_id, None)
+    if not poll:
+        return
+
+    await fetch_poll_reactions(poll, PRIORITY_REFRESH)
+    update_coalescer.request(poll_id, PRIORITY_REFRESH)
+    scheduler.schedule(poll_id, time.time() + bot.RECONCILE_INTERVAL, reconcile_poll)
+
+
+async def reconcile_all_polls(key):
+    by_channel = defaultdict(list)
+    for poll in bot.polls.values():
+        if bot.leases.owns(poll.poll_id):
+            by_channel[poll.channel_id].append(poll)
+
+    results = await asyncio.gather(*(reconcile_channel(channel_id, channel_polls)
+                                     for channel_id, channel_polls in by_channel.items()), return_exceptions=True)
+    for channel_id, result in zip(by_channel, results):
+        if isinstance(result, Exception):
+            logger.info(f"Failed to reconcile channel {channel_id}: {result}")
+    scheduler.schedule(key, time.time() + bot.RECONCILE_INTERVAL, reconcile_all_polls)
+
+
+async def reconcile_channel(channel_id, channel_polls):
+    in_window, outside = bot.history_window(channel_polls)
+    timestamps = sorted((poll.timestamp for poll in in_window), key=float)
+    remaining = {poll.timestamp: poll for poll in in_window}
+    cursor = None
+    try:
+        while remaining:
+            response = await slack_call(
+                'conversations_history',
+                PRIORITY_REFRESH,
+                channel=channel_id,
+                oldest=timestamps[0],
+                latest=timestamps[-1],
+                inclusive=True,
+                limit=200,
+                cursor=cursor
+            )
+            for message in response['messages']:
+                poll = remaining.get(message['ts'])
+                if poll is not None and not bot.reactions_truncated(poll, message.get('reactions', [])):
+                    del remaining[message['ts']]
+                    bot.apply_message_reactions(poll, message.get('reactions', []))
+                    update_coalescer.request(poll.poll_id, PRIORITY_REFRESH)
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not response.get('has_more') or not cursor:
+                break
+    except Exception as e:
+        logger.info(f"Failed to read history for channel {channel_id}, falling back to reactions_get: {e}")
+
+    fallback = list(remaining.values()) + outside
+    await asyncio.gather(*(fetch_poll_reactions(poll, PRIORITY_REFRESH) for poll in fallback))
+    for poll in fallback:
+        update_coalescer.request(poll.poll_id, PRIORITY_REFRESH)
+
+
+async def expire_poll(poll_id):
+    scheduler.cancel(poll_id)
+    await cleanup_poll(poll_id)
+
+
+@metrics.timed("poll_cleanup_seconds")
+async def cleanup_poll(poll_id):
+    # Unregistered before the first await, so coalesced updates still queued for this poll find nothing to render;
+    # it is put back if the lease turns out to be lost
+    poll = bot.polls.remove(poll_id)
+    if poll is None:
+        return
+    if not await asyncio.to_thread(bot.leases.begin_close, poll_id):
+        bot.polls.add(poll)
+        logger.info("Lease lost before closing, leaving it to the new owner", extra={'poll_id': poll_id})
+        return
+    poll_results = await fetch_poll_reactions(poll, PRIORITY_HIGH)
+    if poll_results is None:
+        bot.polls.add(poll)
+        scheduler.add_job(poll_id, bot.close_retry_at(poll_id), expire_poll)
+        logger.info("No reactions to close on, retrying", extra={'poll_id': poll_id})
+        return
+    if bot.needs_voter_list(poll, poll_results):
+        await sync_voter_list(poll, PRIORITY_HIGH)
+
+    try:
+        await slack_call(
+            'chat_update',
+            PRIORITY_HIGH,
+            channel=poll.channel_id,
+            ts=poll.timestamp,
+            text=bot.build_final_message(poll, poll_results)
+        )
+    except Exception as e:
+        logger.info(f"Failed to post final results: {e}", extra={'poll_id': poll_id})
+
+    await asyncio.to_thread(bot.retire_poll, poll, update_coalescer, rate_limiter)
+
+
+async def seed_reaction(channel_id, poll_ts, emoji):
+    error = None
+    for attempt in range(bot.REACTION_SEED_RETRIES):
+        try:
+            await slack_call(
+                'reactions_add',
+                channel=channel_id,
+                name=emoji,
+                timestamp=poll_ts
+            )
+            return True
+        except SlackApiError as e:
+            error = e
+            if e.response.get('error') == 'already_reacted':
+                return True
+            if e.response.status_code == 429 or e.response.get('error') in bot.REACTION_SEED_FATAL_ERRORS:
+                break
+        except Exception as e:
+            error = e
+        if attempt < bot.REACTION_SEED_RETRIES - 1:
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    logger.info(f"Failed to add reaction '{emoji}': {error}", extra={'channel_id': channel_id, 'message_ts': poll_ts})
+    return False
+
+
+async def post_poll(channel_id, question, options, emojis, duration, max_mentions, option_count):
+    # polls.db writes can wait on another worker's transaction, so they run off the loop
+    poll_id = await asyncio.to_thread(bot.poll_store.allocate_poll_id)
+    poll_info_message, poll_message = bot.build_poll_creation_messages(poll_id, question, options, emojis)
+
+    await slack_call(
+        'chat_postMessage',
+        channel=channel_id,
+        text=poll_info_message
+    )
+    result = await slack_call(
+        'chat_postMessage',
+        channel=channel_id,
+        text=poll_message
+    )
+
+    return await asyncio.to_thread(bot.register_poll, bot.polls, poll_id, channel_id, result['ts'], question, options,
+                                   emojis, duration, max_mentions, option_count)
+
+
+async def create_polls(specs):
+    # Same batching as main.create_polls. Posting stays sequential so each poll's info and poll messages sit
+    # together in the channel; the reactions for the whole batch are then seeded concurrently
+    created = []
+    started = {}
+    for spec in specs:
+        post_start = time.perf_counter()
+        try:
+            poll = await post_poll(**spec)
+        except Exception as e:
+            logger.error(f"Error creating poll: {e}", extra={'question': spec['question']})
+            continue
+        created.append(poll)
+        started[poll.poll_id] = post_start
+
+    async def seed(poll):
+        results = await asyncio.gather(*(seed_reaction(poll.channel_id, poll.timestamp, emoji) for emoji in poll.emojis))
+        return results, time.perf_counter()
+
+    seeded = await asyncio.gather(*(seed(poll) for poll in created))
+    for poll, (poll_seeded, finished) in zip(created, seeded):
+        creation_time = finished - started[poll.poll_id]
+        metrics.observe("poll_creation_seconds", creation_time)
+        logger.info(f"Poll created in {creation_time:.2f}s", extra={'poll_id': poll.poll_id, 'seconds': creation_time,
+                                                                    'reactions_seeded': sum(poll_seeded),
+                                                                    'reactions': len(poll_seeded),
+                                                                    'batch': len(specs)})
+
+    scheduler.add_polls([(poll.poll_id, poll.start_time, poll.duration, None) for poll in created])
+    return [poll.poll_id for poll in created]
+
+
+async def submit_polls(submission):
+    due = []
+    for post_at, spec in bot.expand_poll_template(submission):
+        if post_at <= time.time():
+            due.append(spec)
+        else:
+            post_id = await asyncio.to_thread(bot.poll_store.schedule_post, post_at, spec)
+            key = f"{bot.SCHEDULED_POST_PREFIX}{post_id}"
+            scheduler.add_job(key, post_at, post_scheduled_poll)
+    return await create_polls(due)
+
+
+async def post_scheduled_poll(key):
+    scheduler.cancel(key)
+    spec = await asyncio.to_thread(bot.poll_store.take_scheduled_post, int(key[len(bot.SCHEDULED_POST_PREFIX):]))
+    if spec is not None:
+        await create_polls([spec])
+
+
+async def is_valid_rq(say, rq_channel_id, rq_user_id, rq_poll_id=None):
+    allowed, reply = bot.check_request(bot.polls, rq_channel_id, rq_user_id, rq_poll_id)
+    if reply is not None:
+        how, text = reply
+        if how == "say":
+            await say(text)
+        else:
+            await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=rq_channel_id, user=rq_user_id, text=text)
+    return allowed
+
+
+@app.shortcut("create_poll")
+async def open_create_poll_modal(ack, body):
+    await ack()
+    await slack_call('views_open', PRIORITY_HIGH, trigger_id=body["trigger_id"], view=bot.POLL_CREATION_VIEW)
+
+
+@app.view("poll_creation_view")
+async def handle_poll_submission(ack, body, view, logger):
+    try:
+        submission = bot.parse_poll_submission(view)
+    except bot.InvalidSubmission as e:
+        await ack(response_action="errors", errors=e.errors)
+        return
+    except KeyError as e:
+        await ack()
+        logger.error(f"Missing field in poll submission: {e}")
+        return
+    await ack()
+
+    try:
+        poll_ids = await submit_polls(submission)
+        logger.info(f"Poll created: {submission['question']}", extra={'poll_ids': poll_ids,
+                                                                       'sessions': len(submission['sessions'])})
+
+    except Exception as e:
+        logger.error(f"Error creating poll: {e}")
+
+
+@app.command("/endpoll")
+async def handle_endpoll(ack, body, say):
+    await ack()
+    poll_id_str = body['text'].strip()
+    channel_id = body['channel_id']
+    user_id = body['user_id']
+    if not poll_id_str.isdigit():
+        await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=user_id,
+                         text="Please provide a valid poll ID.")
+        return
+    poll_id = int(poll_id_str)
+    if not await is_valid_rq(say, channel_id, user_id, poll_id):
+        return
+    if poll_id not in bot.polls:
+        await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=user_id,
+                         text=f"No active poll found with ID: {poll_id}.")
+        return
+    if not bot.leases.owns(poll_id):
+        await asyncio.to_thread(bot.poll_store.request_end, poll_id)
+        await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=user_id,
+                         text=f"Poll (ID: {poll_id}) will be ended in a few seconds.")
+        return
+
+    was_scheduled = scheduler.cancel(poll_id)
+    # Under the poll's lock, so no job or update for it is running while the final results go out
+    await scheduler.run_exclusive(poll_id, cleanup_poll)
+
+    if was_scheduled:
+        text = f"Poll (ID: {poll_id}) has been ended successfully."
+    else:
+        text = f"Poll (ID: {poll_id}) is not running, but has been deactivated."
+    await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=user_id, text=text)
+
+
+@app.command("/signups")
+async def handle_signups(ack, body):
+    await ack()
+    try:
+        # The archive query is blocking SQLite, so it runs off the loop
+        text = await asyncio.to_thread(bot.signups_reply, body['user_id'], body.get('text', ''))
+    except (ValueError, sqlite3.Error) as e:
+        text = f"Couldn't read the poll archive: {e}"
+    await slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=body['channel_id'], user=body['user_id'], text=text)
+
+
+def apply_reaction_event(event, added):
+    poll = bot.route_reaction_event(bot.polls, event, added)
+    if poll is None:
+        return
+    if bot.leases.owns(poll.poll_id):
+        update_coalescer.request(poll.poll_id)
+    else:
+        bot.leases.mark_dirty(poll.poll_id)
+
+
+@app.event("reaction_added")
+async def handle_reaction_added(ack, body):
+    await ack()
+    apply_reaction_event(body['event'], added=True)
+
+
+@app.event("reaction_removed")
+async def handle_reaction_removed(ack, body):
+    await ack()
+    apply_reaction_event(body['event'], added=False)
+
+
+async def resync_poll(poll_id):
+    poll = bot.polls.get(poll_id, None)
+    if poll:
+        await fetch_poll_reactions(poll, PRIORITY_REFRESH)
+        update_coalescer.request(poll_id, PRIORITY_REFRESH)
+
+
+async def run_leases():
+    # The store sync is blocking SQLite, so it runs on a thread; applying it touches the scheduler, so that stays here
+    while True:
+        try:
+            changes = await asyncio.to_thread(bot.leases.tick, bot.polls)
+            bot.apply_lease_changes(changes, scheduler, update_coalescer, resync_poll, expire_poll, post_scheduled_poll)
+            await rate_limiter.set_workers(bot.leases.workers)
+        except Exception as e:
+            logger.info(f"Lease sync failed: {e}")
+        await asyncio.sleep(bot.LEASE_INTERVAL)
+
+
+async def start_runtime():
+    # One keep-alive pool for every Web API call the bot makes
+    connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE_SECONDS)
+    client.session = aiohttp.ClientSession(connector=connector)
+    scheduler.start()
+    return client.session
+
+
+async def main():
+    print(bot.guh)
+    startup_start = time.perf_counter()
+    bot.start_metrics_server()
+    bot.cleanup_orphaned_processes()
+    bot.perms.start()
+    bot.user_directory.warm()
+
+    bot.poll_store = bot.PollStore()
+    bot.poll_store.migrate_from_file()
+    bot.polls = PollState(bot.poll_store.load_polls())
+    session = await start_runtime()
+    bot.reload_active_polls(scheduler)
+    bot.reload_scheduled_posts(scheduler, post_scheduled_poll)
+    if bot.RECONCILE_MODE == "channel":
+        scheduler.add_job(bot.RECONCILE_SWEEP, time.time() + bot.RECONCILE_INTERVAL, reconcile_all_polls)
+    if bot.leases.enabled:
+        spawn(run_leases())
+
+    handler = AsyncSocketModeHandler(app, os.getenv("SLACK_APP_TOKEN"))
+    try:
+        await handler.connect_async()
+        logger.info(f"Ready in {time.perf_counter() - startup_start:.2f}s with {len(bot.polls)} active polls "
+                    f"(async runtime)")
+        await asyncio.Event().wait()
+    finally:
+        await handler.close_async()
+        await session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,434 @@
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from multiprocessing import Manager, Process
+
+import fake_slack
+from poll_state import Poll, PollState
+
+
+def make_poll_dict(poll_id):
+    return {
+        'active': True,
+        'channel_id': f"C{poll_id % 4}",
+        'timestamp': f"1700000000.{poll_id:06d}",
+        'options': [f"Option {i}" for i in range(6)],
+        'emojis': [f"emoji_{i}" for i in range(6)],
+        'max_mentions': 12,
+        'start_time': time.time(),
+        'duration': 24,
+        'option_count': 1,
+    }
+
+
+def manager_hot_path(polls, channel_id, timestamp):
+    # What a reaction event cost before: scan every poll through the proxy, then read fields off it
+    for poll_id, poll_data in polls.items():
+        if poll_data['timestamp'] == timestamp and poll_data['channel_id'] == channel_id:
+            return polls[poll_id]['option_count'], polls[poll_id]['max_mentions'], len(polls[poll_id]['emojis'])
+
+
+def state_hot_path(polls, channel_id, timestamp):
+    poll = polls.find_by_message(channel_id, timestamp)
+    if poll is not None:
+        return poll.option_count, poll.max_mentions, len(poll.emojis)
+
+
+def run(label, hot_path, polls, lookups):
+    start = time.perf_counter()
+    for channel_id, timestamp in lookups:
+        hot_path(polls, channel_id, timestamp)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8}: {len(lookups)} lookups in {elapsed:.3f}s ({elapsed / len(lookups) * 1e6:.1f} us/lookup)")
+    return elapsed
+
+
+def bench_state(args):
+    poll_dicts = {poll_id: make_poll_dict(poll_id) for poll_id in range(args.polls)}
+    # Half the events hit a poll message, half are reactions on unrelated messages
+    lookups = []
+    for i in range(args.events):
+        poll_data = poll_dicts[i % args.polls]
+        if i % 2:
+            lookups.append((poll_data['channel_id'], poll_data['timestamp']))
+        else:
+            lookups.append((poll_data['channel_id'], f"1600000000.{i:06d}"))
+
+    manager = Manager()
+    manager_polls = manager.dict(poll_dicts)
+    state = PollState(Poll.from_dict(poll_id, poll_data) for poll_id, poll_data in poll_dicts.items())
+
+    manager_time = run("manager", manager_hot_path, manager_polls, lookups)
+    state_time = run("state", state_hot_path, state, lookups)
+    print(f"speedup: {manager_time / state_time:.0f}x")
+    manager.shutdown()
+
+
+def fake_request(base_url, path, payload=None):
+    data = json.dumps(payload or {}).encode()
+    request = urllib.request.Request(base_url + path, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def poll_submission(channel_id, options, emojis, duration, max_mentions, option_count):
+    values = {
+        "channel_select_block": {"selected_channel": {"selected_conversation": channel_id}},
+        "question_block": {"question": {"value": "Build session signup"}},
+        "options_block": {"options": {"value": ", ".join(options)}},
+        "emojis_block": {"emojis": {"value": ", ".join(emojis)}},
+        "duration_block": {"duration": {"value": str(duration)}},
+        "max_mentions_block": {"max_mentions": {"value": str(max_mentions)}},
+        "option_count_block": {"option_count": {"value": str(option_count)}},
+    }
+    return {
+        "type": "view_submission",
+        "team": {"id": "T0001", "domain": "bench"},
+        "user": {"id": "U00000", "team_id": "T0001"},
+        "api_app_id": "A0001",
+        "trigger_id": "bench",
+        "view": {"id": "VBENCH", "type": "modal", "callback_id": "poll_creation_view", "state": {"values": values}},
+    }
+
+
+def reaction_event(event_type, user, reaction, channel_id, ts, seq):
+    return {
+        "type": "event_callback",
+        "team_id": "T0001",
+        "api_app_id": "A0001",
+        "event_id": f"Ev{seq:08d}",
+        "event_time": int(time.time()),
+        "event": {
+            "type": event_type,
+            "user": user,
+            "reaction": reaction,
+            "item": {"type": "message", "channel": channel_id, "ts": ts},
+            "item_user": fake_slack.BOT_USER_ID,
+            "event_ts": f"{time.time():.6f}",
+        },
+    }
+
+
+def wait_for(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    return None
+
+
+class ThreadRuntime:
+    # Drives main.py's App; dispatch returns once the listener has run on Bolt's worker threads
+    def __init__(self, bot, args):
+        from slack_bolt.request import BoltRequest
+        self.BoltRequest = BoltRequest
+        self.bot = bot
+        self.scheduler = bot.scheduler
+        if args.reconcile_interval and args.reconcile_mode == "channel":
+            bot.scheduler.add_job(bot.RECONCILE_SWEEP, time.time() + args.reconcile_interval, bot.reconcile_all_polls)
+        bot.scheduler.start()
+        bot.update_sender.start()
+
+    def dispatch(self, body):
+        self.bot.app.dispatch(self.BoltRequest(body=body, mode="socket_mode"))
+
+    def cancel(self, poll_id):
+        self.scheduler.cancel(poll_id)
+
+
+class AsyncRuntime:
+    # Drives async_main.py's AsyncApp on an event loop running in a background thread
+    def __init__(self, bot, args):
+        import asyncio
+        import async_main
+        from slack_bolt.request.async_request import AsyncBoltRequest
+        self.asyncio = asyncio
+        self.AsyncBoltRequest = AsyncBoltRequest
+        self.runtime = async_main
+        self.scheduler = async_main.scheduler
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="bench-loop", daemon=True).start()
+        self.run(async_main.start_runtime())
+        if args.reconcile_interval and args.reconcile_mode == "channel":
+            self.run(self._add_sweep(args.reconcile_interval))
+
+    async def _add_sweep(self, interval):
+        self.scheduler.add_job(self.runtime.bot.RECONCILE_SWEEP, time.time() + interval, self.runtime.reconcile_all_polls)
+
+    async def _cancel(self, poll_id):
+        self.scheduler.cancel(poll_id)
+
+    def run(self, coro):
+        return self.asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def dispatch(self, body):
+        self.run(self.runtime.app.async_dispatch(self.AsyncBoltRequest(body=body, mode="socket_mode")))
+
+    def cancel(self, poll_id):
+        self.run(self._cancel(poll_id))
+
+
+def run_load_scenario(bot, runtime, base_url, n_polls, n_voters, args, rng):
+    fake_request(base_url, "/_bench/reset", {'latency': args.latency, 'rate_limit_ratio': args.rate_limit_ratio})
+    for poll in bot.polls.values():
+        runtime.cancel(poll.poll_id)
+    bot.polls = PollState()
+    bot.user_directory.prefetch()
+
+    emojis = [f"emoji_{i}" for i in range(args.options)]
+    options = [f"Session {i}" for i in range(args.options)]
+    created_at = time.time()
+    for i in range(n_polls):
+        runtime.dispatch(poll_submission(f"C{i % args.channels:04d}", options, emojis, 24, -1, 2))
+    if not wait_for(lambda: len(bot.polls) == n_polls, 60):
+        raise RuntimeError(f"only {len(bot.polls)} of {n_polls} polls were created")
+    creation_time = time.time() - created_at
+    polls = bot.polls.values()
+    # Let the first refresh of every poll land before measuring the storm
+    wait_for(lambda: all(poll.tally is not None for poll in polls), 30)
+
+    before = fake_request(base_url, "/_bench/snapshot")
+    expected = {}
+    events = []
+    for poll in polls:
+        counts = dict.fromkeys(emojis, 0)
+        for voter in range(n_voters):
+            user = f"U{voter:05d}"
+            emoji = rng.choice(emojis)
+            events.append((poll, user, emoji, True))
+            counts[emoji] += 1
+            if rng.random() < args.remove_ratio:
+                events.append((poll, user, emoji, False))
+                counts[emoji] -= 1
+        expected[(poll.channel_id, poll.timestamp)] = counts
+    rng.shuffle(events)
+    # A removal must follow its add; the shuffle is only across users and polls
+    seen = set()
+    ordered = []
+    deferred = []
+    for event in events:
+        key = (event[0].poll_id, event[1], event[2])
+        if event[3]:
+            seen.add(key)
+            ordered.append(event)
+        elif key in seen:
+            ordered.append(event)
+        else:
+            deferred.append(event)
+    ordered.extend(deferred)
+
+    last_event_at = {}
+    storm_start = time.time()
+    for seq, (poll, user, emoji, added) in enumerate(ordered):
+        fake_request(base_url, "/_bench/reaction", {'channel': poll.channel_id, 'ts': poll.timestamp, 'name': emoji,
+                                                    'user': user, 'added': added})
+        event_type = "reaction_added" if added else "reaction_removed"
+        runtime.dispatch(reaction_event(event_type, user, emoji, poll.channel_id, poll.timestamp, seq))
+        last_event_at[(poll.channel_id, poll.timestamp)] = time.time()
+    storm_time = time.time() - storm_start
+
+    def converged():
+        snapshot = fake_request(base_url, "/_bench/snapshot")
+        messages = {(m['channel'], m['ts']): m for m in snapshot['messages']}
+        for key, counts in expected.items():
+            text = messages[key]['text']
+            for emoji, count in counts.items():
+                if f":{emoji}: " not in text or f":{emoji}: Session {emojis.index(emoji)}: {count} votes" not in text:
+                    return None
+        return snapshot
+
+    after = wait_for(converged, args.timeout)
+    if after is None:
+        raise RuntimeError("poll messages did not converge on the expected counts")
+    messages = {(m['channel'], m['ts']): m for m in after['messages']}
+    latencies = [max(0.0, messages[key]['updated_at'] - last_event_at[key]) for key in expected]
+
+    calls = {method: after['calls'].get(method, 0) - before['calls'].get(method, 0) for method in after['calls']}
+    total_calls = sum(calls.values())
+    return {
+        'polls': n_polls,
+        'voters': n_voters,
+        'votes': len(ordered),
+        'api_calls': total_calls,
+        'calls_per_vote': total_calls / len(ordered),
+        'chat_update': calls.get('chat.update', 0),
+        'reactions_get': calls.get('reactions.get', 0),
+        'history': calls.get('conversations.history', 0),
+        'rate_limited': sum(after['rate_limited'].values()),
+        'creation_s': creation_time,
+        'storm_s': storm_time,
+        'latency_p50': statistics.median(latencies),
+        'latency_max': max(latencies),
+        'max_message': max(len(messages[key]['text']) for key in expected),
+        'rss_mb': rss_mb(),
+    }
+
+
+def start_fake_slack(port):
+    server = Process(target=fake_slack.serve, args=(port,), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port}"
+
+    def server_up():
+        try:
+            return fake_request(base_url, "/_bench/snapshot")
+        except OSError:
+            return None
+
+    wait_for(server_up, 10)
+    # main.py reads its config at import time and writes polls.db/log.log to the working directory
+    os.environ['SLACK_BOT_TOKEN'] = "xoxb-bench"
+    os.environ['SLACK_API_URL'] = base_url + "/api/"
+    return server, base_url
+
+
+def bench_load(args):
+    os.environ['UPDATE_COALESCE_WINDOW'] = str(args.coalesce_window)
+    server, base_url = start_fake_slack(args.port)
+    os.chdir(tempfile.mkdtemp(prefix="poll-bench-"))
+    import main as bot
+
+    bot.poll_store = bot.PollStore()
+    bot.polls = PollState()
+    if args.reconcile_interval:
+        bot.RECONCILE_INTERVAL = args.reconcile_interval
+        bot.RECONCILE_MODE = args.reconcile_mode
+    runtime = (AsyncRuntime if args.runtime == "async" else ThreadRuntime)(bot, args)
+
+    rng = random.Random(args.seed)
+    header = f"{'polls':>5} {'voters':>6} {'votes':>6} {'calls':>6} {'call/vote':>9} {'update':>6} {'r.get':>5} {'hist':>4} " \
+             f"{'429s':>4} {'create s':>8} {'p50 s':>6} {'max s':>6} {'msg chr':>7} {'rss MB':>7}"
+    print(header)
+    try:
+        for n_polls in args.polls:
+            for n_voters in args.voters:
+                r = run_load_scenario(bot, runtime, base_url, n_polls, n_voters, args, rng)
+                print(f"{r['polls']:>5} {r['voters']:>6} {r['votes']:>6} {r['api_calls']:>6} {r['calls_per_vote']:>9.2f} "
+                      f"{r['chat_update']:>6} {r['reactions_get']:>5} {r['history']:>4} {r['rate_limited']:>4} {r['creation_s']:>8.2f} "
+                      f"{r['latency_p50']:>6.2f} {r['latency_max']:>6.2f} {r['max_message']:>7} {r['rss_mb']:>7.1f}")
+    finally:
+        server.terminate()
+
+
+def bench_leases(args):
+    # Two workers' lease syncs against one temporary polls.db, each through its own connection as separate
+    # processes would: even spread, close fencing, end/dirty handoff and failover after the TTL
+    server, _ = start_fake_slack(args.port)
+    os.chdir(tempfile.mkdtemp(prefix="poll-leases-"))
+    import main as bot
+
+    a, b = bot.PollStore(), bot.PollStore()
+    ttl = args.ttl
+    all_ids = set()
+    for i in range(args.polls):
+        poll_id = a.allocate_poll_id()
+        a.save_poll(Poll.from_dict(poll_id, make_poll_dict(poll_id)))
+        all_ids.add(poll_id)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        owned_a, _, _, _ = a.sync_leases("a", ttl)
+        check("a lone worker claims every poll", owned_a == all_ids)
+        owned_b, _, _, _ = b.sync_leases("b", ttl)
+        check("a new worker waits for the owner to hand polls back", not owned_b)
+        owned_a, _, _, workers = a.sync_leases("a", ttl)
+        owned_b, _, _, _ = b.sync_leases("b", ttl)
+        check("two workers split the polls evenly", workers == 2 and not owned_a & owned_b
+              and owned_a | owned_b == all_ids and abs(len(owned_a) - len(owned_b)) <= 1)
+
+        closing, ended, dirty = sorted(owned_a)[:3]
+        check("only the owner can close a poll", not b.begin_close("b", closing, ttl) and a.begin_close("a", closing, ttl))
+        b.request_end(ended)
+        b.sync_leases("b", ttl, {dirty})
+        owned_a, resync_a, end_a, _ = a.sync_leases("a", ttl)
+        check("/endpoll on another worker reaches the owner", end_a == {ended})
+        check("reactions seen by another worker flag the poll for the owner", resync_a == {dirty})
+        owned_a, resync_a, _, _ = a.sync_leases("a", ttl)
+        check("a dirty flag is handed over once", not resync_a)
+
+        # a stops syncing, as if it died mid-close
+        time.sleep(ttl + 0.2)
+        owned_b, _, end_b, workers = b.sync_leases("b", ttl)
+        check("a dead worker's polls move to the survivor", owned_b == all_ids and workers == 1)
+        check("a close cut short by the failover is finished by the new owner", {closing, ended} <= end_b)
+        check("the old owner can no longer close", not a.begin_close("a", dirty, ttl))
+
+        b.archive_poll(b.load_polls([closing])[0])
+        owned_b, _, _, _ = b.sync_leases("b", ttl)
+        check("archived polls drop out of the leases", owned_b == all_ids - {closing})
+        stale = a.load_polls([dirty])[0]
+        b.archive_poll(b.load_polls([dirty])[0])
+        stale.voters_ts = "1.000001"
+        check("the old owner's voter list update can't bring back an archived poll",
+              not a.update_poll(stale) and dirty not in b.poll_ids())
+    finally:
+        server.terminate()
+    if failures:
+        raise SystemExit(f"{len(failures)} lease checks failed")
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll bot benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    state = subparsers.add_parser("state", help="compare poll lookups through PollState and a Manager dict")
+    state.add_argument("--polls", type=int, default=30)
+    state.add_argument("--events", type=int, default=2000)
+    state.set_defaults(func=bench_state)
+
+    load = subparsers.add_parser("load", help="replay reaction storms through the Bolt handlers against fake_slack.py")
+    load.add_argument("--polls", type=int_list, default=[1, 10, 30], help="comma-separated poll counts")
+    load.add_argument("--voters", type=int_list, default=[10, 60], help="comma-separated voters per poll")
+    load.add_argument("--options", type=int, default=4)
+    load.add_argument("--channels", type=int, default=2)
+    load.add_argument("--remove-ratio", type=float, default=0.1)
+    load.add_argument("--latency", type=float, default=0.0, help="seconds of fake API latency per call")
+    load.add_argument("--rate-limit-ratio", type=float, default=0.0, help="fraction of fake API calls answered with 429")
+    load.add_argument("--coalesce-window", type=float, default=3)
+    load.add_argument("--reconcile-interval", type=float, default=0, help="seconds between reconcile sweeps (0: off)")
+    load.add_argument("--reconcile-mode", choices=["channel", "poll"], default="channel")
+    load.add_argument("--runtime", choices=["threads", "async"], default="threads",
+                      help="threads: main.py's App, async: async_main.py's AsyncApp")
+    load.add_argument("--timeout", type=float, default=60)
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--seed", type=int, default=1325)
+    load.set_defaults(func=bench_load)
+
+    lease = subparsers.add_parser("leases", help="check two workers' poll leases against a temporary polls.db")
+    lease.add_argument("--polls", type=int, default=10)
+    lease.add_argument("--ttl", type=float, default=1.0, help="lease TTL in seconds")
+    lease.add_argument("--port", type=int, default=8765)
+    lease.set_defaults(func=bench_leases)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
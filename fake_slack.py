@@ -0,0 +1,237 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+BOT_USER_ID = "U07ML8X2DE1"
+# Like Slack, message reactions list only this many users (count stays exact) unless reactions.get has full set
+REACTION_USERS_LIMIT = 50
+
+
+class FakeSlack:
+    # In-memory stand-in for the Slack Web API methods main.py uses. Point the bot at it with
+    # SLACK_API_URL=http://127.0.0.1:<port>/api/
+    def __init__(self, latency=0.0, rate_limit_ratio=0.0, retry_after=1):
+        self.lock = threading.Lock()
+        self.next_ts = int(time.time()) * 1000000
+        self.configure(latency, rate_limit_ratio, retry_after)
+        self.reset()
+
+    def configure(self, latency=0.0, rate_limit_ratio=0.0, retry_after=1):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+
+    def reset(self):
+        with self.lock:
+            self.messages = {}
+            self.calls = Counter()
+            self.rate_limited = Counter()
+            self.users = {f"U{i:05d}": {'id': f"U{i:05d}", 'name': f"member{i}"} for i in range(1000)}
+            self.users[BOT_USER_ID] = {'id': BOT_USER_ID, 'name': "signup-bot", 'is_bot': True}
+            # S00001 stands in for a "build leads" group for permission checks
+            self.usergroups = {"S00001": [f"U{i:05d}" for i in range(10)]}
+
+    def _message(self, channel, ts):
+        message = self.messages.get((channel, ts))
+        if message is None:
+            raise KeyError('message_not_found')
+        return message
+
+    def _add_reaction(self, message, name, user):
+        users = message['reactions'].setdefault(name, [])
+        if user in users:
+            raise KeyError('already_reacted')
+        users.append(user)
+
+    def _remove_reaction(self, message, name, user):
+        users = message['reactions'].get(name, [])
+        if user not in users:
+            raise KeyError('no_reaction')
+        users.remove(user)
+        if not users:
+            del message['reactions'][name]
+
+    def call(self, method, args):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            if self.rate_limit_ratio and method != 'auth.test' and random.random() < self.rate_limit_ratio:
+                self.rate_limited[method] += 1
+                return 429, {'ok': False, 'error': 'ratelimited'}
+            try:
+                return 200, self._dispatch(method, args)
+            except KeyError as e:
+                return 200, {'ok': False, 'error': e.args[0]}
+
+    def _dispatch(self, method, args):
+        if method == 'auth.test':
+            return {'ok': True, 'user_id': BOT_USER_ID, 'bot_id': "B0001", 'team_id': "T0001", 'team': "bench",
+                    'url': "https://bench.slack.com/"}
+        if method == 'chat.postMessage':
+            self.next_ts += 1
+            ts = f"{self.next_ts // 1000000}.{self.next_ts % 1000000:06d}"
+            self.messages[(args['channel'], ts)] = {'text': args.get('text', ''), 'reactions': {},
+                                                    'thread_ts': args.get('thread_ts'), 'updated_at': time.time()}
+            return {'ok': True, 'channel': args['channel'], 'ts': ts, 'message': {'text': args.get('text', '')}}
+        if method == 'chat.update':
+            message = self._message(args['channel'], args['ts'])
+            message['text'] = args.get('text', '')
+            message['updated_at'] = time.time()
+            return {'ok': True, 'channel': args['channel'], 'ts': args['ts']}
+        if method == 'chat.getPermalink':
+            self._message(args['channel'], args['message_ts'])
+            return {'ok': True, 'channel': args['channel'],
+                    'permalink': f"https://bench.slack.com/archives/{args['channel']}/p{args['message_ts'].replace('.', '')}"}
+        if method == 'chat.postEphemeral':
+            return {'ok': True, 'message_ts': str(time.time())}
+        if method == 'reactions.add':
+            self._add_reaction(self._message(args['channel'], args['timestamp']), args['name'], BOT_USER_ID)
+            return {'ok': True}
+        if method == 'reactions.get':
+            message = self._message(args['channel'], args['timestamp'])
+            limit = None if args.get('full') in (True, 'true', '1') else REACTION_USERS_LIMIT
+            reactions = [{'name': name, 'users': users[:limit], 'count': len(users)}
+                         for name, users in message['reactions'].items()]
+            return {'ok': True, 'type': 'message', 'channel': args['channel'],
+                    'message': {'ts': args['timestamp'], 'text': message['text'], 'reactions': reactions}}
+        if method == 'conversations.history':
+            oldest = float(args.get('oldest') or 0)
+            latest = float(args.get('latest') or time.time())
+            inclusive = args.get('inclusive') in (True, 'true', '1')
+            in_window = sorted(((ts, message) for (channel, ts), message in self.messages.items()
+                                if channel == args['channel'] and not message['thread_ts'] and (oldest <= float(ts) <= latest if inclusive
+                                                                   else oldest < float(ts) < latest)),
+                               key=lambda item: float(item[0]), reverse=True)
+            start = int(args.get('cursor') or 0)
+            limit = int(args.get('limit') or 100)
+            page = [{'type': 'message', 'ts': ts, 'text': message['text'],
+                     'reactions': [{'name': name, 'users': users[:REACTION_USERS_LIMIT], 'count': len(users)}
+                                   for name, users in message['reactions'].items()]}
+                    for ts, message in in_window[start:start + limit]]
+            has_more = start + limit < len(in_window)
+            return {'ok': True, 'messages': page, 'has_more': has_more,
+                    'response_metadata': {'next_cursor': str(start + limit) if has_more else ""}}
+        if method == 'users.info':
+            user = self.users.get(args['user'])
+            if user is None:
+                raise KeyError('user_not_found')
+            return {'ok': True, 'user': user}
+        if method == 'users.list':
+            members = list(self.users.values())
+            start = int(args.get('cursor') or 0)
+            limit = int(args.get('limit') or 200)
+            next_cursor = str(start + limit) if start + limit < len(members) else ""
+            return {'ok': True, 'members': members[start:start + limit],
+                    'response_metadata': {'next_cursor': next_cursor}}
+        if method == 'usergroups.users.list':
+            users = self.usergroups.get(args['usergroup'])
+            if users is None:
+                raise KeyError('no_such_subteam')
+            return {'ok': True, 'users': list(users)}
+        if method == 'views.open':
+            return {'ok': True}
+        raise KeyError('unknown_method')
+
+    # Driver-side hooks, used by the benchmark to act as workspace members
+
+    def user_reaction(self, channel, ts, name, user, added):
+        with self.lock:
+            message = self._message(channel, ts)
+            if added:
+                self._add_reaction(message, name, user)
+            else:
+                self._remove_reaction(message, name, user)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'rate_limited': dict(self.rate_limited),
+                'messages': [{'channel': channel, 'ts': ts, 'text': message['text'],
+                              'updated_at': message['updated_at']}
+                             for (channel, ts), message in self.messages.items()],
+            }
+
+
+def make_handler(slack):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _args(self):
+            url = urlparse(self.path)
+            args = dict(parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = self.rfile.read(length).decode()
+                if 'json' in (self.headers.get('Content-Type') or ''):
+                    args.update(json.loads(body))
+                else:
+                    args.update(parse_qsl(body))
+            return url.path, args
+
+        def _reply(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self):
+            path, args = self._args()
+            if path.startswith('/api/'):
+                status, payload = slack.call(path[len('/api/'):], args)
+                headers = {'Retry-After': str(slack.retry_after)} if status == 429 else None
+                self._reply(status, payload, headers)
+            elif path == '/_bench/reaction':
+                try:
+                    added = args['added'] in (True, 'true', '1')
+                    slack.user_reaction(args['channel'], args['ts'], args['name'], args['user'], added)
+                    self._reply(200, {'ok': True})
+                except KeyError as e:
+                    self._reply(200, {'ok': False, 'error': e.args[0]})
+            elif path == '/_bench/snapshot':
+                self._reply(200, slack.snapshot())
+            elif path == '/_bench/reset':
+                slack.configure(float(args.get('latency', 0)), float(args.get('rate_limit_ratio', 0)),
+                                int(args.get('retry_after', 1)))
+                slack.reset()
+                self._reply(200, {'ok': True})
+            else:
+                self._reply(404, {'ok': False, 'error': 'not_found'})
+
+        do_GET = _handle
+        do_POST = _handle
+
+    return Handler
+
+
+def serve(port=8765, latency=0.0, rate_limit_ratio=0.0, retry_after=1):
+    slack = FakeSlack(latency, rate_limit_ratio, retry_after)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(slack))
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fake of the Slack Web API methods used by the poll bot")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="fraction of calls answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    print(f"Fake Slack API on http://127.0.0.1:{args.port}/api/")
+    serve(args.port, args.latency, args.rate_limit_ratio, args.retry_after)
+
+
+if __name__ == "__main__":
+    main()
@@ -54,423 +54,2012 @@ guh = """coolest electrical lead B)
                     .,..,,,,.
 """
 
+import atexit
 import logging
+import logging.handlers
 import json
 import os
+import random
+import signal
+import socket
+import sqlite3
+import sys
 import time
-from multiprocessing import Process, Manager
-from collections import defaultdict
+import heapq
+import functools
+import inspect
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, OrderedDict, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from dotenv import load_dotenv
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from collections import deque
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from poll_archive import PollArchive, create_archive_tables, format_signups, insert_archived_poll, parse_signups_query
+from poll_state import Poll, PollOption, PollState
 import time
 
-# To keep track of update timestamps
-update_times = deque()
-MAX_UPDATES_PER_MINUTE = 50
-
 load_dotenv()
 
-app = App(token=os.getenv("SLACK_BOT_TOKEN"))
+if os.getenv("SLACK_API_URL"):
+    # Point the bot at fake_slack.py (or any other stand-in) instead of the real workspace
+    app = App(client=WebClient(token=os.getenv("SLACK_BOT_TOKEN"), base_url=os.getenv("SLACK_API_URL")))
+else:
+    app = App(token=os.getenv("SLACK_BOT_TOKEN"))
 POLL_FILE = "polls.json"
+POLL_DB = "polls.db"
 POLL_PROCESSES_FILE = "poll_processes.json"
-poll_processes = {}
+STARTUP_RECONCILE_WINDOW = 60
 POLL_PERMS = "perms.json"
+LOG_FILE = "log.log"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 5 * 2 ** 20))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+# Set to a TimedRotatingFileHandler interval ("midnight", "H", ...) to rotate by time instead of size
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+LOG_QUEUE_SIZE = 10000
+LOG_FIELD_LIMIT = 2000
+LOG_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def bounded(value):
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > LOG_FIELD_LIMIT:
+        return text[:LOG_FIELD_LIMIT] + f"... ({len(text) - LOG_FIELD_LIMIT} more chars)"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; anything passed through `extra=` (poll_id, timings, stats) becomes its own key
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': bounded(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in LOG_RECORD_FIELDS:
+                entry[key] = bounded(value) if isinstance(value, str) else value
+        if record.exc_info:
+            entry['exc'] = bounded(self.formatException(record.exc_info))
+        return json.dumps(entry, default=lambda value: bounded(repr(value)))
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    # Callers only enqueue the record: formatting and disk writes happen on the listener thread, and a full
+    # queue drops the record instead of stalling an event ack
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    if LOG_ROTATE_WHEN:
+        file_handler = logging.handlers.TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN,
+                                                                 backupCount=LOG_BACKUP_COUNT)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                            backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = LogQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler
+
+
+log_handler = configure_logging()
 logger = logging.getLogger(__name__)
-logging.basicConfig(filename='log.log', level=logging.INFO)
 logger.info('Started')
 
 
-def is_valid_rq(say, polls, rq_channel_id, rq_user_id, rq_poll_id=None):
-    level = perms.get(rq_user_id, None)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    # Counters, latency histograms and gauges rendered in the Prometheus text format
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(HISTOGRAM_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def gauge(self, name, read):
+        # `read` is called at scrape time, so gauges mirror existing counters instead of duplicating them
+        self.gauges[name] = read
+
+    def timed(self, name):
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self):
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self.histograms.items())
+        for (name, labels), value in counters:
+            lines.append(f"{name}{labels_text(labels)} {value:g}")
+        for (name, labels), (buckets, total, count) in histograms:
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS, buckets):
+                lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{labels_text(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{labels_text(labels)} {total:g}")
+            lines.append(f"{name}_count{labels_text(labels)} {count}")
+        for name, read in sorted(self.gauges.items()):
+            try:
+                lines.append(f"{name} {read():g}")
+            except Exception as e:
+                logger.info(f"Failed to read gauge {name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def sample_profile(seconds, interval=0.005, limit=50):
+    # Wall-clock sampling across every thread, returned as collapsed stacks ("outer;inner count") for flame graphs.
+    # cProfile only sees the thread that enables it, which misses the scheduler and Bolt's listener threads.
+    stacks = Counter()
+    own_thread = threading.get_ident()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common(limit)) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = metrics.render()
+        elif url.path == "/debug/profile":
+            seconds = min(float(parse_qs(url.query).get("seconds", ["10"])[0]), 120)
+            body = sample_profile(seconds)
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics on http://127.0.0.1:{port}/metrics")
+    return server
+
+
+def check_request(polls, rq_channel_id, rq_user_id, rq_poll_id=None):
+    # Returns (allowed, reply); reply is None or (how, text) where how is "say" or "ephemeral"
+    level = perms.level(rq_user_id)
 
     if level is None:  # Not in whitelist
-        say(f":wompwomp2::wompwomp2: <@{rq_user_id}> you are not in the whitelist! :wompwomp2::wompwomp2:")
-        return False
+        return False, ("say", f":wompwomp2::wompwomp2: <@{rq_user_id}> you are not in the whitelist! :wompwomp2::wompwomp2:")
 
     # We're creating a poll, so check if we have a valid level to do this action and check if ID is valid
     if rq_poll_id is None:
         if level >= 0:
-            return True
+            return True, None
 
     poll = polls.get(rq_poll_id, None)
 
     if poll is None:
-        app.client.chat_postEphemeral(channel=rq_channel_id, user=rq_user_id, text=f":wompwomp2::wompwomp2: <@{rq_user_id}> Invalid Poll "
-                                                                                   f"ID! :wompwomp2::wompwomp2:")
-        return False
+        return False, ("ephemeral", f":wompwomp2::wompwomp2: <@{rq_user_id}> Invalid Poll ID! :wompwomp2::wompwomp2:")
 
     if level == 1:
-        if poll['channel_id'] != rq_channel_id:
-            app.client.chat_postEphemeral(channel=rq_channel_id, user=rq_user_id, text=f":wompwomp2::wompwomp2: <@{rq_user_id}> You can't "
-                                                                                       f"end a poll from a different "
-                                                                                       f"channel! :wompwomp2::wompwomp2:")
-            return False
+        if poll.channel_id != rq_channel_id:
+            return False, ("ephemeral", f":wompwomp2::wompwomp2: <@{rq_user_id}> You can't end a poll from a different "
+                                        f"channel! :wompwomp2::wompwomp2:")
         else:
-            return True
+            return True, None
     else:
-        say(f":wompwomp2::wompwomp2: <@{rq_user_id}> you are not authorized! :wompwomp2::wompwomp2:")
-        return False
+        return False, ("say", f":wompwomp2::wompwomp2: <@{rq_user_id}> you are not authorized! :wompwomp2::wompwomp2:")
 
 
-def save_polls_to_file(polls):
-    with open(POLL_FILE, 'w') as file:
-        json_polls = {str(k): dict(v) for k, v in polls.items()}
-        json.dump(json_polls, file)
+def is_valid_rq(say, polls, rq_channel_id, rq_user_id, rq_poll_id=None):
+    allowed, reply = check_request(polls, rq_channel_id, rq_user_id, rq_poll_id)
+    if reply is not None:
+        how, text = reply
+        if how == "say":
+            say(text)
+        else:
+            slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=rq_channel_id, user=rq_user_id, text=text)
+    return allowed
+
+
+class PollStore:
+    # SQLite-backed poll state: each create/cleanup touches one row instead of rewriting every poll,
+    # and WAL journaling means a crash mid-write can't take the other polls down with it
+    def __init__(self, path=POLL_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS polls (poll_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('next_poll_id', 0)")
+        # Poll ownership for multi-worker deployments (see PollLeases); unused by a single worker
+        self.conn.execute("CREATE TABLE IF NOT EXISTS leases (poll_id INTEGER PRIMARY KEY, owner TEXT, "
+                          "expires_at REAL NOT NULL DEFAULT 0, dirty INTEGER NOT NULL DEFAULT 0, "
+                          "end_requested INTEGER NOT NULL DEFAULT 0, closing INTEGER NOT NULL DEFAULT 0)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS scheduled_posts (post_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "post_at REAL NOT NULL, data TEXT NOT NULL)")
+        create_archive_tables(self.conn)
+
+    def allocate_poll_id(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                poll_id = self.conn.execute("SELECT value FROM meta WHERE key = 'next_poll_id'").fetchone()[0]
+                self.conn.execute("UPDATE meta SET value = ? WHERE key = 'next_poll_id'", (poll_id + 1,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return poll_id
+
+    def save_poll(self, poll, owner=None, ttl=0):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO polls (poll_id, data) VALUES (?, ?)", (poll.poll_id, json.dumps(poll.to_dict())))
+                if owner is not None:
+                    # The creating worker owns the poll from the start, so no other worker claims it on its next sync
+                    self.conn.execute("INSERT OR REPLACE INTO leases (poll_id, owner, expires_at) VALUES (?, ?, ?)",
+                                      (poll.poll_id, owner, time.time() + ttl))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def update_poll(self, poll):
+        # Rewrites a live poll's row; unlike save_poll a row another worker has archived meanwhile stays gone
+        with self.lock:
+            return self.conn.execute("UPDATE polls SET data = ? WHERE poll_id = ?",
+                                     (json.dumps(poll.to_dict()), poll.poll_id)).rowcount == 1
+
+    def delete_poll(self, poll_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
+
+    def archive_poll(self, poll, end_time=None):
+        # Moves a finished poll and its counted votes from the live table into the archive in one transaction
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                insert_archived_poll(self.conn, poll, end_time or time.time())
+                self.conn.execute("DELETE FROM polls WHERE poll_id = ?", (poll.poll_id,))
+                self.conn.execute("DELETE FROM leases WHERE poll_id = ?", (poll.poll_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def schedule_post(self, post_at, spec):
+        with self.lock:
+            return self.conn.execute("INSERT INTO scheduled_posts (post_at, data) VALUES (?, ?)",
+                                     (post_at, json.dumps(spec))).lastrowid
+
+    def take_scheduled_post(self, post_id):
+        # Claims the post by deleting it, so it is created at most once
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT data FROM scheduled_posts WHERE post_id = ?", (post_id,)).fetchone()
+                self.conn.execute("DELETE FROM scheduled_posts WHERE post_id = ?", (post_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[0]) if row else None
+
+    def load_scheduled_posts(self):
+        with self.lock:
+            return self.conn.execute("SELECT post_id, post_at FROM scheduled_posts").fetchall()
+
+    def load_polls(self, poll_ids=None):
+        with self.lock:
+            if poll_ids is None:
+                rows = self.conn.execute("SELECT poll_id, data FROM polls").fetchall()
+            else:
+                rows = [row for poll_id in poll_ids
+                        for row in self.conn.execute("SELECT poll_id, data FROM polls WHERE poll_id = ?", (poll_id,))]
+        return [Poll.from_dict(poll_id, json.loads(data)) for poll_id, data in rows]
+
+    def poll_ids(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT poll_id FROM polls")}
+
+    def sync_leases(self, worker_id, ttl, dirty=()):
+        # One transaction per worker tick: heartbeat, flag polls this worker saw events for, renew its leases and
+        # move towards an even share, claiming free or expired leases or handing back surplus ones.
+        # Returns (owned, resync, end) sets of poll IDs for this worker and the number of live workers.
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO workers (worker_id, seen_at) VALUES (?, ?)", (worker_id, now))
+                self.conn.execute("DELETE FROM workers WHERE seen_at < ?", (now - 10 * ttl,))
+                self.conn.execute("INSERT OR IGNORE INTO leases (poll_id) SELECT poll_id FROM polls")
+                self.conn.executemany("UPDATE leases SET dirty = 1 WHERE poll_id = ?", ((poll_id,) for poll_id in dirty))
+                self.conn.execute("UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at > ?",
+                                  (now + ttl, worker_id, now))
+                workers = self.conn.execute("SELECT COUNT(*) FROM workers WHERE seen_at > ?", (now - ttl,)).fetchone()[0]
+                total = self.conn.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+                share = -(-total // max(1, workers))
+                mine = self.conn.execute("SELECT COUNT(*) FROM leases WHERE owner = ? AND expires_at > ?",
+                                         (worker_id, now)).fetchone()[0]
+                if mine < share:
+                    # A lease that expired mid-close is taken over as an end request so the close gets finished
+                    self.conn.execute(
+                        "UPDATE leases SET owner = ?, expires_at = ?, end_requested = MAX(end_requested, closing), "
+                        "closing = 0 WHERE poll_id IN (SELECT poll_id FROM leases WHERE owner IS NULL OR expires_at <= ? "
+                        "ORDER BY poll_id LIMIT ?)",
+                        (worker_id, now + ttl, now, share - mine)
+                    )
+                elif mine > share:
+                    self.conn.execute(
+                        "UPDATE leases SET owner = NULL, expires_at = 0 WHERE poll_id IN (SELECT poll_id FROM leases "
+                        "WHERE owner = ? AND closing = 0 AND end_requested = 0 ORDER BY poll_id DESC LIMIT ?)",
+                        (worker_id, mine - share)
+                    )
+                rows = self.conn.execute("SELECT poll_id, dirty, end_requested FROM leases WHERE owner = ? AND expires_at > ?",
+                                         (worker_id, now)).fetchall()
+                self.conn.execute("UPDATE leases SET dirty = 0 WHERE owner = ? AND dirty = 1", (worker_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        owned = {poll_id for poll_id, _, _ in rows}
+        resync = {poll_id for poll_id, is_dirty, _ in rows if is_dirty}
+        end = {poll_id for poll_id, _, end_requested in rows if end_requested}
+        return owned, resync, end, max(1, workers)
+
+    def begin_close(self, worker_id, poll_id, ttl):
+        # Fences the final results: only a worker whose lease is still live can mark the poll as closing
+        with self.lock:
+            cursor = self.conn.execute("UPDATE leases SET closing = 1, expires_at = ? WHERE poll_id = ? AND owner = ? "
+                                       "AND expires_at > ?", (time.time() + ttl, poll_id, worker_id, time.time()))
+            return cursor.rowcount == 1
+
+    def request_end(self, poll_id):
+        with self.lock:
+            return self.conn.execute("UPDATE leases SET end_requested = 1 WHERE poll_id = ?", (poll_id,)).rowcount == 1
+
+    def migrate_from_file(self, path=POLL_FILE):
+        # One-off import of the old polls.json, recorded in meta so it is never imported twice
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_poll_file'").fetchone():
+                return
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as file:
+            try:
+                json_polls = {int(k): v for k, v in json.load(file).items()}
+            except json.JSONDecodeError as e:
+                logger.info(f"Failed to migrate {path}: {e}")
+                json_polls = {}
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for poll_id, poll_data in json_polls.items():
+                self.conn.execute("INSERT OR IGNORE INTO polls (poll_id, data) VALUES (?, ?)", (poll_id, json.dumps(poll_data)))
+            if json_polls:
+                self.conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'next_poll_id'", (max(json_polls) + 1,))
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_poll_file', 1)")
+            self.conn.execute("COMMIT")
+        logger.info(f"Migrated {len(json_polls)} polls from {path}")
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_REFRESH = 2
+
+# Requests per minute for each Slack rate limit tier; chat.postMessage is "special" at roughly 1/s
+SLACK_TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100, 'special': 60}
+SLACK_METHOD_TIERS = {
+    'chat_postMessage': 'special',
+    'chat_update': 3,
+    'chat_postEphemeral': 4,
+    'chat_getPermalink': 4,
+    'reactions_get': 3,
+    'reactions_add': 3,
+    'users_info': 4,
+    'users_list': 2,
+    'usergroups_users_list': 2,
+    'conversations_history': 3,
+    'views_open': 4,
+}
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, workers=1):
+        self.rate_per_minute = rate_per_minute
+        self.tokens = float('inf')
+        self.resize(workers)
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.waiters = []
+
+    def resize(self, workers):
+        # Slack's limits are per workspace, so each of the live workers gets an equal slice
+        self.rate = self.rate_per_minute / 60 / workers
+        self.capacity = max(1.0, self.rate_per_minute / 6 / workers)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def delay(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+def make_bucket(method, workers=1):
+    return TokenBucket(SLACK_TIER_RATES[SLACK_METHOD_TIERS.get(method, 3)], workers)
+
+
+def retry_after_seconds(response):
+    retry_after = response.headers.get('retry-after', response.headers.get('Retry-After', 1))
+    if isinstance(retry_after, list):
+        retry_after = retry_after[0]
+    return float(retry_after)
+
+
+class SlackRateLimiter:
+    # One token bucket per Slack method, shared by every caller in the process. Callers waiting on the same
+    # bucket are served lowest priority value first, so final results jump ahead of countdown refreshes.
+    def __init__(self):
+        self.buckets = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.throttled = 0
+        self.workers = 1
+
+    def _bucket(self, method):
+        bucket = self.buckets.get(method)
+        if bucket is None:
+            bucket = self.buckets[method] = make_bucket(method, self.workers)
+        return bucket
+
+    def set_workers(self, workers):
+        # Called with the live worker count from each lease sync when several workers share the workspace
+        with self.cond:
+            if workers == self.workers:
+                return
+            self.workers = workers
+            for bucket in self.buckets.values():
+                bucket.resize(workers)
+            self.cond.notify_all()
+
+    def acquire(self, method, priority):
+        with self.cond:
+            bucket = self._bucket(method)
+            entry = (priority, next(self.counter))
+            heapq.heappush(bucket.waiters, entry)
+            while True:
+                delay = bucket.delay(time.monotonic())
+                if bucket.waiters[0] == entry and delay <= 0:
+                    heapq.heappop(bucket.waiters)
+                    bucket.tokens -= 1
+                    self.cond.notify_all()
+                    return
+                self.cond.wait(delay if bucket.waiters[0] == entry else None)
+
+    def release(self, method):
+        # Hands back a token a caller acquired but didn't use
+        with self.cond:
+            bucket = self._bucket(method)
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+            self.cond.notify_all()
+
+    def rate(self, method):
+        # Calls per second this process may make to the method
+        with self.cond:
+            return self._bucket(method).rate
+
+    def block(self, method, retry_after):
+        with self.cond:
+            bucket = self._bucket(method)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            self.throttled += 1
+            self.cond.notify_all()
+
+    def call(self, method, priority=PRIORITY_NORMAL, render=None, **kwargs):
+        # render() builds the arguments once the token is held, so a call that queued behind others still sends the
+        # latest state; returning None gives the token back and skips the call
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            wait_start = time.perf_counter()
+            self.acquire(method, priority)
+            start = time.perf_counter()
+            metrics.observe("slack_rate_limit_wait_seconds", start - wait_start, method=method)
+            if render is not None:
+                kwargs = render()
+                if kwargs is None:
+                    self.release(method)
+                    return None
+            try:
+                response = getattr(app.client, method)(**kwargs)
+                metrics.inc("slack_api_calls_total", method=method, result="ok")
+                return response
+            except SlackApiError as e:
+                rate_limited = e.response.status_code == 429
+                metrics.inc("slack_api_calls_total", method=method, result="ratelimited" if rate_limited else "error")
+                if not rate_limited or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                retry_after = retry_after_seconds(e.response)
+                logger.info(f"Rate limited on {method}, retrying in {retry_after}s")
+                self.block(method, retry_after)
+            except Exception:
+                metrics.inc("slack_api_calls_total", method=method, result="error")
+                raise
+            finally:
+                metrics.observe("slack_api_call_seconds", time.perf_counter() - start, method=method)
+
+
+rate_limiter = SlackRateLimiter()
+
+
+def slack_call(method, priority=PRIORITY_NORMAL, render=None, **kwargs):
+    return rate_limiter.call(method, priority, render, **kwargs)
+
+
+USER_CACHE_TTL = 6 * 3600
+USER_CACHE_SIZE = 5000
+# A failed users_list sweep is retried after 30s, doubling up to 30 minutes
+USER_PREFETCH_BACKOFF = 30
+USER_PREFETCH_BACKOFF_MAX = 1800
+
+
+class UserDirectory:
+    # TTL + LRU cache of Slack user records, warmed in bulk by a paginated users_list sweep, that decides whose
+    # reactions count: bots and deactivated members don't. Lookups never call Slack themselves: a miss on a stale
+    # directory starts one background sweep, shared by every caller and backed off after a failure, so tallying
+    # costs no per-user calls in either runtime.
+    def __init__(self, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        self.sweep = None
+        self.warmed_at = 0
+        self.retry_at = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, user, expires_at):
+        self.users[user['id']] = (expires_at, user)
+        self.users.move_to_end(user['id'])
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+
+    def _lookup(self, user_id, now):
+        entry = self.users.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self.users[user_id]
+            return None
+        self.users.move_to_end(user_id)
+        return entry[1]
+
+    def prefetch(self):
+        # Single-flight: a caller that finds a sweep running waits for it instead of starting another
+        with self.lock:
+            sweep = self.sweep
+            if sweep is None:
+                self.sweep = threading.Event()
+        if sweep is not None:
+            sweep.wait()
+            return
 
+        cursor = None
+        fetched = 0
+        try:
+            while True:
+                response = slack_call('users_list', PRIORITY_REFRESH, limit=200, cursor=cursor)
+                expires_at = time.time() + self.ttl
+                with self.lock:
+                    for member in response['members']:
+                        self._put(member, expires_at)
+                fetched += len(response['members'])
+                cursor = response.get('response_metadata', {}).get('next_cursor')
+                if not cursor:
+                    break
+        except Exception as e:
+            self.failures += 1
+            self.retry_at = time.time() + min(USER_PREFETCH_BACKOFF * 2 ** (self.failures - 1), USER_PREFETCH_BACKOFF_MAX)
+            logger.info(f"Failed to prefetch users: {e}")
+        else:
+            self.failures = 0
+            self.warmed_at = time.time()
+            logger.info(f"Prefetched {fetched} users")
+        finally:
+            with self.lock:
+                self.sweep.set()
+                self.sweep = None
+
+    def warm(self):
+        # Start a background sweep if the directory is stale, none is running and the last failure has backed off
+        now = time.time()
+        with self.lock:
+            if self.sweep is not None or now - self.warmed_at <= self.ttl or now < self.retry_at:
+                return
+        threading.Thread(target=self.prefetch, name="user-prefetch", daemon=True).start()
+
+    def get(self, user_id):
+        with self.lock:
+            user = self._lookup(user_id, time.time())
+            if user is not None:
+                self.hits += 1
+                return user
+            self.misses += 1
+        self.warm()
+        return None
+
+    def is_voter(self, user_id):
+        # This bot never counts, even before the first sweep; members not in the directory yet do
+        if user_id == BOT_USER_ID:
+            return False
+        user = self.get(user_id)
+        return user is None or not (user.get('is_bot') or user.get('deleted'))
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.users)}
+
+
+user_directory = UserDirectory()
+
+PERMS_CHECK_INTERVAL = 5
+USERGROUP_REFRESH_INTERVAL = int(os.getenv("USERGROUP_REFRESH_INTERVAL", 600))
+
+
+class PermissionService:
+    # perms.json maps member IDs (U...) or Slack usergroup IDs (S...) to a level. The file is re-read when its
+    # mtime changes, and usergroup membership comes from a usergroups_users_list cache refreshed in the
+    # background, so a check is a dict lookup with no API call. A member's own entry beats any group entry;
+    # otherwise they get the highest level among their groups.
+    def __init__(self, path=POLL_PERMS, refresh_interval=USERGROUP_REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.levels = {}
+        self.group_levels = {}
+        self.members = {}
+        self.index = {}
+        self.mtime = None
+        self.checked_at = 0
+        self.reloads = 0
+        self.thread = None
+
+    def start(self):
+        self.reload()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="usergroup-refresh", daemon=True)
+            self.thread.start()
+
+    def level(self, user_id):
+        now = time.time()
+        if now - self.checked_at >= PERMS_CHECK_INTERVAL:
+            self.checked_at = now
+            self.reload()
+        return self.index.get(user_id)
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.info(f"Failed to read permissions: {e}")
+            return False
+        with self.lock:
+            if mtime == self.mtime:
+                return False
+            try:
+                with open(self.path, 'r') as file:
+                    entries = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                # Keep serving the last good file; a half-written save is retried on the next check
+                logger.info(f"Failed to load permissions: {e}")
+                return False
+            self.mtime = mtime
+            self.levels = {key: level for key, level in entries.items() if not key.startswith('S')}
+            self.group_levels = {key: level for key, level in entries.items() if key.startswith('S')}
+            new_groups = set(self.group_levels) - set(self.members)
+            self._rebuild()
+            self.reloads += 1
+        logger.info("Permissions reloaded", extra={'members': len(self.levels), 'usergroups': len(self.group_levels)})
+        if new_groups:
+            self.wakeup.set()
+        return True
+
+    def _rebuild(self):
+        index = {}
+        for group_id, level in self.group_levels.items():
+            for user_id in self.members.get(group_id, ()):
+                if user_id not in index or level > index[user_id]:
+                    index[user_id] = level
+        index.update(self.levels)
+        self.index = index
+
+    def refresh_groups(self):
+        with self.lock:
+            group_ids = list(self.group_levels)
+        fetched = {}
+        for group_id in group_ids:
+            try:
+                fetched[group_id] = frozenset(slack_call('usergroups_users_list', PRIORITY_REFRESH,
+                                                         usergroup=group_id)['users'])
+            except Exception as e:
+                # Keep the last known membership rather than locking the group out
+                logger.info(f"Failed to list usergroup {group_id}: {e}")
+        with self.lock:
+            self.members = {group_id: fetched.get(group_id, self.members.get(group_id, frozenset()))
+                            for group_id in self.group_levels}
+            self._rebuild()
+
+    def _run(self):
+        while True:
+            self.refresh_groups()
+            self.wakeup.wait(self.refresh_interval)
+            self.wakeup.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'reloads': self.reloads, 'indexed': len(self.index), 'usergroups': len(self.group_levels)}
+
+
+perms = PermissionService()
+
+# POLL_LEASES=1 lets several workers on one host share a local polls.db (WAL needs shared memory, so no network
+# filesystems); each needs a WORKER_ID unique among live workers
+LEASES_ENABLED = os.getenv("POLL_LEASES", "0") == "1"
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_TTL = int(os.getenv("LEASE_TTL", 15))
+LEASE_INTERVAL = 2
+
+
+class PollLeases:
+    # Time-limited poll ownership kept in the shared store. Every LEASE_INTERVAL a worker mirrors polls other
+    # workers created or archived, renews its leases and claims free or expired ones up to an even share; only
+    # the owner schedules, refreshes and closes a poll. A worker that gets a reaction or /endpoll for a poll it
+    # doesn't own flags it for the owner's next tick. With leases off every poll counts as owned.
+    def __init__(self, enabled=LEASES_ENABLED, worker_id=WORKER_ID, ttl=LEASE_TTL):
+        self.enabled = enabled
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.owned = set()
+        self.dirty = set()
+        self.stored = set()
+        self.workers = 1
+
+    def owns(self, poll_id):
+        return not self.enabled or poll_id in self.owned
+
+    def adopt(self, poll_id):
+        with self.lock:
+            self.owned.add(poll_id)
+
+    def forget(self, poll_id):
+        with self.lock:
+            self.owned.discard(poll_id)
+
+    def mark_dirty(self, poll_id):
+        with self.lock:
+            self.dirty.add(poll_id)
+
+    def begin_close(self, poll_id):
+        if not self.enabled:
+            return True
+        return poll_store.begin_close(self.worker_id, poll_id, self.ttl)
+
+    def tick(self, polls):
+        # Returns (acquired, lost, resync, end, posts) for the runtime to apply to its scheduler
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+        stored = poll_store.poll_ids()
+        known = {poll.poll_id for poll in polls.values()}
+        for poll in poll_store.load_polls(stored - known):
+            polls.add(poll)
+        # Only polls seen in the store before can have been archived; a poll missing from it may still be mid-create here
+        vanished = (known & self.stored) - stored
+        for poll_id in vanished:
+            polls.remove(poll_id)
+        self.stored = stored
+
+        # Held across the sync so a poll adopted at creation can't be mistaken for a lost lease
+        with self.lock:
+            owned, resync, end, self.workers = poll_store.sync_leases(self.worker_id, self.ttl, dirty)
+            acquired = owned - self.owned
+            lost = (self.owned - owned) | vanished
+            self.owned = owned
+        # The previous owner may have posted the voter list thread after this worker mirrored the poll
+        for stored_poll in poll_store.load_polls(acquired):
+            poll = polls.get(stored_poll.poll_id, None)
+            if poll:
+                poll.voters_ts, poll.voters_link = stored_poll.voters_ts, stored_poll.voters_link
+        return acquired, lost, resync, end, poll_store.load_scheduled_posts()
+
+    def stats(self):
+        with self.lock:
+            return {'owned': len(self.owned), 'known': len(self.stored)}
+
+
+leases = PollLeases()
+
+
+# Scheduled jobs block on Slack (closing a poll, the channel reconcile sweep, posting scheduled polls), so they run
+# on a pool and a slow one only holds up its own poll
+SCHEDULER_THREADS = int(os.getenv("SCHEDULER_THREADS", 8))
+
+
+class PollScheduler:
+    # One thread keeps a min-heap of (deadline, seq, poll_id, generation, job) entries and hands due jobs to a
+    # pool, where they run under a per-poll lock so one poll's jobs never overlap. Cancelling a poll bumps its
+    # generation so stale heap entries are dropped when they surface.
+    def __init__(self, threads=SCHEDULER_THREADS):
+        self.heap = []
+        self.generations = {}
+        self.locks = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="poll-job")
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="poll-scheduler", daemon=True)
+            self.thread.start()
+
+    def add_polls(self, entries):
+        # (poll_id, start_time, duration, first_run) tuples registered under one lock hold with a single wake-up
+        now = time.time()
+        with self.cond:
+            for poll_id, start_time, duration, first_run in entries:
+                first_run = first_run or now
+                generation = self.generations[poll_id] = next(self.counter)
+                jobs = [(first_run, refresh_poll)]
+                if RECONCILE_MODE == "poll":
+                    jobs.append((first_run + RECONCILE_INTERVAL, reconcile_poll))
+                if duration > 0:
+                    jobs.append((max(start_time + duration * 3600, first_run), expire_poll))
+                for deadline, job in jobs:
+                    heapq.heappush(self.heap, (deadline, next(self.counter), poll_id, generation, job))
+            self.cond.notify()
+
+    def add_job(self, key, deadline, job):
+        # Work that isn't tied to one poll (the channel reconcile sweep) shares the heap under its own key
+        with self.cond:
+            self.generations[key] = next(self.counter)
+        self.schedule(key, deadline, job)
+
+    def schedule(self, poll_id, deadline, job):
+        with self.cond:
+            generation = self.generations.get(poll_id)
+            if generation is None:
+                return False
+            heapq.heappush(self.heap, (deadline, next(self.counter), poll_id, generation, job))
+            self.cond.notify()
+            return True
 
-def load_polls_from_file():
-    if os.path.exists(POLL_FILE):
-        with open(POLL_FILE, 'r') as file:
+    def _lock(self, poll_id):
+        with self.cond:
+            return self.locks.setdefault(poll_id, threading.RLock())
+
+    def cancel(self, poll_id):
+        # Taking the poll's lock means none of its jobs is still running once cancel returns; other polls' jobs
+        # don't hold it up
+        with self._lock(poll_id):
+            with self.cond:
+                self.locks.pop(poll_id, None)
+                return self.generations.pop(poll_id, None) is not None
+
+    def is_scheduled(self, poll_id):
+        with self.cond:
+            return poll_id in self.generations
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+                deadline, _, poll_id, generation, job = heapq.heappop(self.heap)
+                if self.generations.get(poll_id) != generation:
+                    continue
+            self.pool.submit(self._run_job, poll_id, generation, job)
+
+    def _run_job(self, poll_id, generation, job):
+        with self._lock(poll_id):
+            # Cancelled (and maybe re-added) while this job waited for the lock or a pool thread
+            with self.cond:
+                if self.generations.get(poll_id) != generation:
+                    return
             try:
-                json_polls = json.load(file)
-                return {int(k): v for k, v in json_polls.items()}
-            except json.JSONDecodeError:
-                return {}
-    return {}
+                job(poll_id)
+            except Exception as e:
+                logger.info(f"Scheduled job {job.__name__} failed: {e}", extra={'poll_id': poll_id})
 
 
-def save_poll_processes_to_file(poll_processes):
-    with open(POLL_PROCESSES_FILE, 'w') as file:
-        json.dump({str(k): v.pid for k, v in poll_processes.items()}, file)
+scheduler = PollScheduler()
+REFRESH_INTERVAL = 10
+# The countdown shows whole minutes until this many seconds remain, then minutes and seconds
+COUNTDOWN_SECONDS_THRESHOLD = 600
 
 
-def load_poll_processes_from_file():
-    if os.path.exists(POLL_PROCESSES_FILE):
-        with open(POLL_PROCESSES_FILE, 'r') as file:
-            try:
-                return {int(k): v for k, v in json.load(file).items()}
-            except json.JSONDecodeError:
-                return {}
-    return {}
+def refresh_poll(poll_id):
+    poll = polls.get(poll_id, None)
+    if not poll:
+        scheduler.cancel(poll_id)
+        return
+
+    request_poll_update(poll_id, PRIORITY_REFRESH)
+    next_refresh = next_countdown_refresh(poll)
+    if next_refresh is not None:
+        scheduler.schedule(poll_id, next_refresh, refresh_poll)
+
 
+def next_countdown_refresh(poll):
+    # Polls without a time limit have no countdown to tick; vote changes are pushed by reaction events
+    if poll.duration <= 0:
+        return None
+    remaining_time = poll.duration * 3600 - (time.time() - poll.start_time)
+    return time.time() + countdown_refresh_interval(remaining_time)
 
-def process_poll(polls, poll_id, channel_id):
-    poll = polls[poll_id]
-    stripped_emojis = poll['emojis']
-    options = poll['options']
-    max_mentions = poll['max_mentions']
-    poll_results = poll['results']
 
+def countdown_refresh_interval(remaining_time):
+    if remaining_time > 3600:
+        return 300
+    if remaining_time > COUNTDOWN_SECONDS_THRESHOLD:
+        return 60
+    return REFRESH_INTERVAL
+
+
+def reconcile_poll(poll_id):
+    poll = polls.get(poll_id, None)
+    if not poll:
+        return
+
+    fetch_poll_reactions(poll, PRIORITY_REFRESH)
+    request_poll_update(poll_id, PRIORITY_REFRESH)
+    scheduler.schedule(poll_id, time.time() + RECONCILE_INTERVAL, reconcile_poll)
+
+
+def reconcile_all_polls(key):
+    by_channel = defaultdict(list)
+    for poll in polls.values():
+        if leases.owns(poll.poll_id):
+            by_channel[poll.channel_id].append(poll)
+
+    for channel_id, channel_polls in by_channel.items():
+        try:
+            reconcile_channel(channel_id, channel_polls)
+        except Exception as e:
+            logger.info(f"Failed to reconcile channel {channel_id}: {e}")
+    scheduler.schedule(key, time.time() + RECONCILE_INTERVAL, reconcile_all_polls)
+
+
+def history_window(channel_polls):
+    # Polls posted within RECONCILE_MAX_WINDOW of the channel's newest poll share one conversations_history window;
+    # an older no-time-limit poll would stretch it over every message since, so those are read one by one instead
+    newest = max(float(poll.timestamp) for poll in channel_polls)
+    in_window = [poll for poll in channel_polls if float(poll.timestamp) >= newest - RECONCILE_MAX_WINDOW]
+    outside = [poll for poll in channel_polls if float(poll.timestamp) < newest - RECONCILE_MAX_WINDOW]
+    return in_window, outside
+
+
+def reconcile_channel(channel_id, channel_polls):
+    # One conversations_history window spanning the channel's recent poll messages instead of a reactions_get each
+    in_window, outside = history_window(channel_polls)
+    timestamps = sorted((poll.timestamp for poll in in_window), key=float)
+    remaining = {poll.timestamp: poll for poll in in_window}
+    cursor = None
     try:
-        reaction = app.client.reactions_get(
-            channel=channel_id,
-            timestamp=poll['timestamp']
+        while remaining:
+            response = slack_call(
+                'conversations_history',
+                PRIORITY_REFRESH,
+                channel=channel_id,
+                oldest=timestamps[0],
+                latest=timestamps[-1],
+                inclusive=True,
+                limit=200,
+                cursor=cursor
+            )
+            for message in response['messages']:
+                poll = remaining.get(message['ts'])
+                if poll is not None and not reactions_truncated(poll, message.get('reactions', [])):
+                    del remaining[message['ts']]
+                    apply_message_reactions(poll, message.get('reactions', []))
+                    request_poll_update(poll.poll_id, PRIORITY_REFRESH)
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not response.get('has_more') or not cursor:
+                break
+    except Exception as e:
+        # e.g. missing_scope when the app lacks channels:history / groups:history for this channel
+        logger.info(f"Failed to read history for channel {channel_id}, falling back to reactions_get: {e}")
+
+    # Anything the window missed (e.g. the message was deleted), listed only partly or left out falls back to a
+    # per-poll reactions_get
+    for poll in list(remaining.values()) + outside:
+        fetch_poll_reactions(poll, PRIORITY_REFRESH)
+        request_poll_update(poll.poll_id, PRIORITY_REFRESH)
+
+
+def expire_poll(poll_id):
+    scheduler.cancel(poll_id)
+    poll = polls.get(poll_id, None)
+    if poll:
+        cleanup_poll(polls, poll_id, poll.channel_id)
+
+
+BOT_USER_ID = "U07ML8X2DE1"
+RECONCILE_INTERVAL = 300
+# "channel" reconciles all polls in a channel with one conversations_history call, "poll" uses reactions_get per poll
+RECONCILE_MODE = os.getenv("RECONCILE_MODE", "channel")
+RECONCILE_SWEEP = "reconcile-sweep"
+# Longest stretch of channel history one sweep pages through, counted back from the channel's newest poll
+RECONCILE_MAX_WINDOW = int(os.getenv("RECONCILE_MAX_WINDOW", 6 * 3600))
+
+
+# Past this many names per option the message shows "+N more", linked to a thread reply that lists everyone
+MENTION_DISPLAY_LIMIT = int(os.getenv("MENTION_DISPLAY_LIMIT", 30))
+# Slack truncates message text at 40,000 characters
+VOTER_LIST_MAX_CHARS = 39000
+
+
+class PollTally:
+    # Voter sets per emoji, kept as insertion-ordered dicts of interned user IDs so adds/removes are O(1) and
+    # mentions keep vote order. `reactions` mirrors what is on the message and `votes` is what counts under the
+    # poll's rules; the two are the same dicts unless the poll is single-choice.
+    def __init__(self, emojis, option_count):
+        self.emojis = list(emojis)
+        self.single_choice = int(option_count) == 1
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.reactions = {emoji: {} for emoji in self.emojis}
+        self.votes = {emoji: {} for emoji in self.emojis} if self.single_choice else self.reactions
+        self.choices = {}
+
+    def _add(self, emoji, user, counted=True):
+        reactors = self.reactions.get(emoji)
+        if reactors is None or user in reactors:
+            return False
+        user = sys.intern(user)
+        reactors[user] = None
+        if self.single_choice:
+            # One vote per user: a reaction on a second option is held back until the first is removed
+            if not counted or user in self.choices:
+                return False
+            self.choices[user] = emoji
+            self.votes[emoji][user] = None
+        return True
+
+    def add(self, emoji, user):
+        with self.lock:
+            return self._add(emoji, user)
+
+    def remove(self, emoji, user):
+        with self.lock:
+            reactors = self.reactions.get(emoji)
+            if reactors is None or user not in reactors:
+                return False
+            del reactors[user]
+            if not self.single_choice:
+                return True
+            if self.choices.get(user) != emoji:
+                return False
+            del self.votes[emoji][user]
+            del self.choices[user]
+            for other in self.emojis:
+                if user in self.reactions[other]:
+                    self.choices[user] = other
+                    self.votes[other][user] = None
+                    break
+            return True
+
+    def reset(self, reactions, partial=()):
+        # reactions maps each emoji to an iterable of user IDs, consumed as it is read. For emojis in partial Slack
+        # listed fewer users than the reaction count, so voters already known from events stay ahead of the listed ones
+        with self.lock:
+            kept = {emoji: list(self.reactions[emoji]) for emoji in partial if emoji in self.reactions}
+            listed = {emoji: list(itertools.chain(kept.get(emoji, ()), reactions.get(emoji, ()))) for emoji in self.emojis}
+            # A single-choice voter stays on the option they were counted on while they still react to it, so a
+            # sweep agrees with the order events arrived in; anyone new gets their first option in emoji order
+            held = {}
+            for emoji, users in listed.items():
+                held.update((user, emoji) for user in set(users) & self.choices.keys() if self.choices[user] == emoji)
+            self._clear()
+            for emoji, users in listed.items():
+                for user in users:
+                    self._add(emoji, user, held.get(user, emoji) == emoji)
+
+    def voters(self):
+        # (emoji, rank, user) for every counted vote, in vote order per option
+        with self.lock:
+            return [(emoji, rank, user) for emoji, voters in self.votes.items() for rank, user in enumerate(voters)]
+
+    def results(self, max_mentions, display_limit=None):
+        # (count, shown voters, hidden) per emoji. The first max_mentions voters are named, at most display_limit of
+        # them on the message itself, so a result costs the same however many people voted
+        display_limit = MENTION_DISPLAY_LIMIT if display_limit is None else display_limit
+        results = {}
+        with self.lock:
+            for emoji, voters in self.votes.items():
+                named = len(voters) if max_mentions < 0 else min(len(voters), max_mentions)
+                shown = tuple(itertools.islice(voters, min(named, display_limit)))
+                results[emoji] = (len(voters), shown, named - len(shown))
+        return results
+
+    def named(self, max_mentions):
+        # Every named voter per emoji, for the thread reply of polls with hidden mentions
+        limit = max_mentions if max_mentions >= 0 else None
+        with self.lock:
+            return {emoji: tuple(itertools.islice(voters, limit)) for emoji, voters in self.votes.items()}
+
+
+@metrics.timed("poll_process_seconds")
+def fetch_poll_reactions(poll, priority=PRIORITY_NORMAL):
+    # Full reconciliation against the message's reactions; reaction events keep the tally current in between
+    try:
+        reaction = slack_call(
+            'reactions_get',
+            priority,
+            channel=poll.channel_id,
+            timestamp=poll.timestamp,
+            full=True
         )
     except Exception as e:
-        logger.info(f"Error fetching reactions: {e}")
-        return
-    voted = []
-    for emoji in stripped_emojis:
-        user_mentions = []
-        reaction_data = next((r for r in reaction['message']['reactions'] if r['name'] == emoji), None)
-        if reaction_data:
-            max_mentions = int(max_mentions)
-            limit = max_mentions + 1 if max_mentions >= 0 else len(reaction_data['users'])
-            for user in reaction_data['users'][:limit]:
-                user_info = app.client.users_info(user=user)
-                if user_info['user']['id'] != "U07ML8X2DE1":
-                    if user_info not in voted:
-                        user_mentions.append(f"<@{user_info['user']['id']}>")
-
-            if int(poll['option_count']) != 1:
-                voted = []
-
-            if user_mentions not in voted:
-                poll_results[emoji] = {
-                    "count": reaction_data['count'] - 1,
-                    "users": ', '.join(user_mentions)
-                }
-                voted.append([f"<@{user_info['user']['id']}>"])
-        else:
-            poll_results[emoji] = {
-                "count": 0,
-                "users": "No votes"
-            }
+        logger.info(f"Error fetching reactions: {e}", extra={'poll_id': poll.poll_id})
+        # With no tally yet (after a restart or a lease handoff) there is nothing to fall back on, and rendering
+        # an empty one would show every option at zero; None tells callers to skip this round
+        if poll.tally is None:
+            return None
+        return poll.tally.results(poll.max_mentions)
+
+    return apply_message_reactions(poll, reaction['message'].get('reactions', []))
+
+
+def apply_message_reactions(poll, message_reactions):
+    reactions = {}
+    partial = set()
+    for reaction_data in message_reactions:
+        if reaction_data['name'] in poll.emojis:
+            users = reaction_data.get('users', [])
+            if reaction_data.get('count', len(users)) > len(users):
+                partial.add(reaction_data['name'])
+            reactions[reaction_data['name']] = eligible_voters(users)
+
+    if poll.tally is None:
+        poll.tally = PollTally(poll.emojis, poll.option_count)
+    poll.tally.reset(reactions, partial)
+
+    return poll.tally.results(poll.max_mentions)
+
+
+def eligible_voters(users):
+    return (user for user in users if user_directory.is_voter(user))
+
+
+def reactions_truncated(poll, message_reactions):
+    # Messages from conversations_history carry a capped user list per reaction; count still covers everyone
+    return any(reaction_data['name'] in poll.emojis and reaction_data.get('count', 0) > len(reaction_data.get('users', []))
+               for reaction_data in message_reactions)
+
+
+def format_option_lines(options, poll_results, more_link=None):
+    lines = ""
+    for option in options:
+        count, voters, hidden = poll_results.get(option.emoji, (0, (), 0))
+        mentions = ', '.join(f"<@{user}>" for user in voters) if count else "No votes"
+        if hidden:
+            mentions += f", <{more_link}|+{hidden} more>" if more_link else f", +{hidden} more"
+        lines += f":{option.emoji}: {option.name}: {count} votes ({mentions})\n"
+    return lines
+
+
+def build_voter_list(poll, named):
+    text = f"Everyone named in poll {poll.poll_id}:\n"
+    for option in poll.options:
+        voters = named.get(option.emoji, ())
+        line = f":{option.emoji}: {option.name}: {', '.join(f'<@{user}>' for user in voters) or 'No votes'}\n"
+        if len(text) + len(line) > VOTER_LIST_MAX_CHARS:
+            return text + "(list too long for one message, export the poll archive once the poll ends)\n"
+        text += line
+    return text
+
+
+def needs_voter_list(poll, poll_results):
+    return poll.voters_ts is not None or any(hidden for _, _, hidden in poll_results.values())
+
+
+UPDATE_COALESCE_WINDOW = float(os.getenv("UPDATE_COALESCE_WINDOW", 3))
+
+
+class UpdateCoalescer:
+    # Per-poll leading/trailing debounce for chat_update. The first request after a quiet window renders
+    # straight away; anything arriving inside the window collapses into one trailing render when it closes,
+    # so the last vote of a burst is always shown.
+    def __init__(self, send, schedule_flush, window=UPDATE_COALESCE_WINDOW, budget=None):
+        # send(poll_id, priority) hands the poll to a sender without waiting; schedule_flush(poll_id, deadline)
+        # arranges a flush() call later; budget() is the chat_update calls per second shared by every poll
+        self.send = send
+        self.schedule_flush = schedule_flush
+        self.window = window
+        self.budget = budget
+        self.last_sent = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.requested = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    def request(self, poll_id, priority=PRIORITY_NORMAL):
+        with self.lock:
+            self.requested += 1
+            if poll_id in self.pending:
+                self.pending[poll_id] = min(self.pending[poll_id], priority)
+                self.coalesced += 1
+                return
+            now = time.time()
+            next_allowed = self.last_sent.get(poll_id, 0) + self._window()
+            deferred = next_allowed > now
+            if deferred:
+                self.pending[poll_id] = priority
+                self.coalesced += 1
+            else:
+                self.last_sent[poll_id] = now
+                self.sent += 1
+
+        if deferred:
+            if not self.schedule_flush(poll_id, next_allowed):
+                self.forget(poll_id)
+            return
+        self.send(poll_id, priority)
+
+    def flush(self, poll_id):
+        with self.lock:
+            if poll_id not in self.pending:
+                return
+            priority = self.pending.pop(poll_id)
+            self.last_sent[poll_id] = time.time()
+            self.sent += 1
+        self.send(poll_id, priority)
+
+    def _window(self):
+        # A fixed window per poll lets N busy polls ask for N times the chat_update budget, so it stretches to
+        # give every poll that has been updated its turn
+        if self.budget is None:
+            return self.window
+        return max(self.window, len(self.last_sent) / self.budget())
+
+    def forget(self, poll_id):
+        with self.lock:
+            self.pending.pop(poll_id, None)
+            self.last_sent.pop(poll_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'requested': self.requested, 'sent': self.sent, 'coalesced': self.coalesced}
+
+
+UPDATE_SENDER_THREADS = 4
+
+
+class PollUpdateSender:
+    # Runs poll updates on its own threads so Bolt's listener threads and the scheduler never wait on the rate
+    # limiter. At most one update per poll is in flight; a request arriving meanwhile marks the poll dirty and
+    # it is sent again, with the latest votes, once the current one finishes.
+    def __init__(self, send, threads=UPDATE_SENDER_THREADS):
+        self.send = send
+        self.threads = threads
+        self.cond = threading.Condition()
+        self.heap = []
+        self.queued = {}
+        self.in_flight = set()
+        self.dirty = {}
+        self.counter = itertools.count()
+        self.workers = []
+
+    def start(self):
+        while len(self.workers) < self.threads:
+            worker = threading.Thread(target=self._run, name=f"poll-update-{len(self.workers)}", daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def submit(self, poll_id, priority=PRIORITY_NORMAL):
+        with self.cond:
+            if poll_id in self.in_flight:
+                self.dirty[poll_id] = min(self.dirty.get(poll_id, priority), priority)
+                return
+            if self.queued.get(poll_id, priority + 1) <= priority:
+                return
+            self.queued[poll_id] = priority
+            heapq.heappush(self.heap, (priority, next(self.counter), poll_id))
+            self.cond.notify()
+
+    def settle(self, poll_id):
+        # Drops anything queued for the poll and returns once no update for it is still running
+        with self.cond:
+            self.queued.pop(poll_id, None)
+            self.dirty.pop(poll_id, None)
+            while poll_id in self.in_flight:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    while not self.heap:
+                        self.cond.wait()
+                    priority, _, poll_id = heapq.heappop(self.heap)
+                    # Entries superseded by a higher priority request, or settled, are skipped
+                    if self.queued.get(poll_id) == priority:
+                        break
+                del self.queued[poll_id]
+                self.in_flight.add(poll_id)
+            try:
+                self.send(poll_id, priority)
+            except Exception as e:
+                logger.info(f"Poll update failed: {e}", extra={'poll_id': poll_id})
+            finally:
+                with self.cond:
+                    self.in_flight.discard(poll_id)
+                    again = self.dirty.pop(poll_id, None)
+                    self.cond.notify_all()
+            if again is not None:
+                self.submit(poll_id, again)
+
+    def stats(self):
+        with self.cond:
+            return {'queued': len(self.queued), 'in_flight': len(self.in_flight)}
+
+
+update_coalescer = UpdateCoalescer(
+    lambda poll_id, priority: update_sender.submit(poll_id, priority),
+    lambda poll_id, deadline: scheduler.schedule(poll_id, deadline, flush_poll_update),
+    budget=lambda: rate_limiter.rate('chat_update')
+)
+
+
+def request_poll_update(poll_id, priority=PRIORITY_NORMAL):
+    update_coalescer.request(poll_id, priority)
+
+
+def flush_poll_update(poll_id):
+    update_coalescer.flush(poll_id)
+
+
+def send_poll_update(poll_id, priority=PRIORITY_NORMAL):
+    poll = polls.get(poll_id, None)
+    if poll:
+        update_poll_results(poll.channel_id, poll_id, polls, priority)
+
+
+update_sender = PollUpdateSender(send_poll_update)
+
+
+class RenderCache:
+    # Hash of the last text successfully sent for each poll, so identical re-renders never reach chat_update
+    def __init__(self):
+        self.hashes = {}
+        self.lock = threading.Lock()
+        self.skipped = 0
+
+    def unchanged(self, poll_id, text):
+        with self.lock:
+            if self.hashes.get(poll_id) == hash(text):
+                self.skipped += 1
+                return True
+            return False
+
+    def remember(self, poll_id, text):
+        with self.lock:
+            self.hashes[poll_id] = hash(text)
+
+    def forget(self, poll_id):
+        with self.lock:
+            self.hashes.pop(poll_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'skipped': self.skipped, 'cached': len(self.hashes)}
+
+
+render_cache = RenderCache()
+voter_list_cache = RenderCache()
+
+metrics.gauge("poll_updates_requested_total", lambda: update_coalescer.stats()['requested'])
+metrics.gauge("poll_updates_sent_total", lambda: update_coalescer.stats()['sent'])
+metrics.gauge("poll_updates_coalesced_total", lambda: update_coalescer.stats()['coalesced'])
+metrics.gauge("poll_updates_skipped_total", lambda: render_cache.stats()['skipped'])
+metrics.gauge("user_cache_hits_total", lambda: user_directory.stats()['hits'])
+metrics.gauge("user_cache_misses_total", lambda: user_directory.stats()['misses'])
+metrics.gauge("slack_rate_limited_total", lambda: rate_limiter.throttled)
+metrics.gauge("active_polls", lambda: len(polls))
+metrics.gauge("log_records_dropped_total", lambda: log_handler.dropped)
+metrics.gauge("permission_reloads_total", lambda: perms.stats()['reloads'])
+metrics.gauge("owned_polls", lambda: leases.stats()['owned'])
+
+
+def build_poll_message(poll, poll_results):
+    max_mentions = poll.max_mentions
+    if poll.single_choice:
+        option_msg = "One vote"
+    else:
+        option_msg = "Unlimited votes"
+    remaining_time = poll.duration * 3600 - (time.time() - poll.start_time)
+    remaining_minutes = max(0, int(remaining_time // 60))
+    remaining_seconds = max(0, int(remaining_time % 60))
+    if remaining_time > COUNTDOWN_SECONDS_THRESHOLD:
+        remaining_msg = f"{remaining_minutes}m"
+    else:
+        remaining_msg = f"{remaining_minutes}m {remaining_seconds}s"
+    max_members_msg = "Max Members: " + (str(max_mentions) if max_mentions >= 0 else "No limit")
+    result_message = f"Poll Results (Time Remaining: {remaining_msg}, {max_members_msg}, {option_msg}):\n"
+    if poll.duration <= 0:
+        result_message = f"Poll Results (Time Remaining: No time limit, {max_members_msg}):\n"
 
-    return poll, max_mentions, options, stripped_emojis, poll_results
+    return result_message + format_option_lines(poll.options, poll_results, poll.voters_link)
 
 
-def update_poll_results(channel_id, poll_id, polls):
-    # Get the current time
-    current_time = time.time()
+def build_final_message(poll, poll_results):
+    return "Final Poll Results:\n" + format_option_lines(poll.options, poll_results, poll.voters_link)
 
-    # Remove timestamps older than one minute
-    while update_times and update_times[0] < current_time - 60:
-        update_times.popleft()
 
-    # Check if the limit has been reached
-    if len(update_times) >= MAX_UPDATES_PER_MINUTE:
-        logger.info("Update limit reached. Skipping update.")
+def sync_voter_list(poll, priority=PRIORITY_NORMAL):
+    # Posts the thread reply the first time names are hidden, then edits it; the message links to it from then on
+    if poll.tally is None:
+        return
+    text = build_voter_list(poll, poll.tally.named(poll.max_mentions))
+    if voter_list_cache.unchanged(poll.poll_id, text):
+        return
+    try:
+        if poll.voters_ts is None:
+            response = slack_call('chat_postMessage', priority, channel=poll.channel_id, thread_ts=poll.timestamp,
+                                  text=text)
+            poll.voters_ts = response['ts']
+            poll.voters_link = slack_call('chat_getPermalink', priority, channel=poll.channel_id,
+                                          message_ts=poll.voters_ts)['permalink']
+            poll_store.update_poll(poll)
+        else:
+            slack_call('chat_update', priority, channel=poll.channel_id, ts=poll.voters_ts, text=text)
+    except Exception as e:
+        logger.info(f"Failed to update voter list: {e}", extra={'poll_id': poll.poll_id})
         return
+    voter_list_cache.remember(poll.poll_id, text)
 
-    # If not reached, record the current timestamp
-    update_times.append(current_time)
-    if polls.get(poll_id, None):
-        poll, max_mentions, options, stripped_emojis, poll_results = process_poll(polls, poll_id, channel_id)
-        if int(poll['option_count']) == 1:
-            option_msg = "One vote"
+
+@metrics.timed("poll_update_seconds")
+def update_poll_results(channel_id, poll_id, polls, priority=PRIORITY_NORMAL):
+    poll = polls.get(poll_id, None)
+    if poll:
+        if poll.tally is None:
+            poll_results = fetch_poll_reactions(poll, priority)
+            if poll_results is None:
+                return
         else:
-            option_msg = "Unlimited votes"
-        remaining_time = poll['duration'] * 3600 - (time.time() - poll['start_time'])
-        remaining_minutes = max(0, int(remaining_time // 60))
-        remaining_seconds = int(remaining_time % 60)
-        max_members_msg = "Max Members: " + (str(max_mentions) if max_mentions >= 0 else "No limit")
-        result_message = f"Poll Results (Time Remaining: {remaining_minutes}m {remaining_seconds}s, {max_members_msg}, {option_msg}):\n"
-        if poll['duration'] <= 0:
-            result_message = f"Poll Results (Time Remaining: No time limit, {max_members_msg}):\n"
-
-        if int(polls[poll_id]['option_count']) == 1:
-            data = poll_results
-            user_set = set()
-            for key, value in data.items():
-                if value['users']:
-                    # Split users by comma and strip whitespace
-                    users = [user.strip() for user in value['users'].split(',')]
-                    # Add new users to the set
-                    unique_users = [user for user in users if user not in user_set]
-                    # Update the set with the new unique users
-                    user_set.update(unique_users)
-                    value['users'] = ', '.join(unique_users)
-
-            poll_results = data
-
-        print(poll_results)
-        for option, emoji in zip(options, stripped_emojis):
-            try:
-                user_mentions = poll_results[emoji]['users']
-                count = poll_results[emoji]['count']
-            except KeyError:
-                user_mentions = ''
-            if user_mentions == '':
-                count = 0
-            user_mentions = str(user_mentions).replace("]", "").replace("[", "").replace("'", "")
-            result_message += f":{emoji}: {option.strip()}: {count} votes ({user_mentions})\n"
+            poll_results = poll.tally.results(poll.max_mentions)
+
+        if needs_voter_list(poll, poll_results):
+            sync_voter_list(poll, priority)
+        if render_cache.unchanged(poll_id, build_poll_message(poll, poll_results)):
+            return
+
+        sent = []
+
+        def render():
+            # Re-rendered once the token is held: votes that arrived while this call queued are included. A poll
+            # that started closing meanwhile is left to cleanup_poll
+            if polls.get(poll_id, None) is not poll:
+                return None
+            text = build_poll_message(poll, poll.tally.results(poll.max_mentions) if poll.tally else poll_results)
+            if render_cache.unchanged(poll_id, text):
+                return None
+            sent.append(text)
+            return {'channel': channel_id, 'ts': poll.timestamp, 'text': text}
 
         try:
-            app.client.chat_update(
-                channel=channel_id,
-                ts=poll['timestamp'],
-                text=result_message
-            )
+            slack_call('chat_update', priority, render=render)
         except Exception as e:
-            logger.info(f"Failed to update message: {e}")
+            logger.info(f"Failed to update message: {e}", extra={'poll_id': poll_id})
+            return
+        if sent:
+            render_cache.remember(poll_id, sent[-1])
 
 
-def create_poll(channel_id, question, options, emojis, duration, max_mentions, option_count, polls, poll_id=None):
-    if poll_id is None:
-        poll_id = len(polls)
+def route_reaction_event(polls, event, added):
+    # Returns the poll whose message needs re-rendering, or None if the event changed nothing
+    poll = polls.find_by_message(event['item']['channel'], event['item'].get('ts'))
+    if poll is None or not user_directory.is_voter(event['user']):
+        return None
 
-    poll_data = polls.get(poll_id, {'active': True, 'channel_id': channel_id})
-    poll_results = poll_data.get('results', {})
+    tally = poll.tally
+    # Without a tally yet, the next update reconciles from reactions_get and picks this event up
+    if tally is not None:
+        if added:
+            changed = tally.add(event['reaction'], event['user'])
+        else:
+            changed = tally.remove(event['reaction'], event['user'])
+        if not changed:
+            return None
+    return poll
 
-    if 'timestamp' not in poll_data:
-        # Create the message with question and poll ID
-        poll_info_message = f"Poll ID: {poll_id}\nQuestion: {question}\n"
-        poll_message = f"*{question}*\n"
-        for option, emoji in zip(options, emojis):
-            poll_message += f":{emoji.strip()}:{option.strip()}\n"
 
-        # Send the poll info message first
-        app.client.chat_postMessage(
-            channel=channel_id,
-            text=poll_info_message
-        )
+def apply_reaction_event(event, added):
+    poll = route_reaction_event(polls, event, added)
+    if poll is None:
+        return
+    if leases.owns(poll.poll_id):
+        request_poll_update(poll.poll_id)
+    else:
+        # Socket Mode hands events to any connected worker; the owner re-reads the reactions on its next tick
+        leases.mark_dirty(poll.poll_id)
 
-        # Then send the poll message
-        result = app.client.chat_postMessage(
-            channel=channel_id,
-            text=poll_message
-        )
 
-        poll_ts = result['ts']
-        poll_data['timestamp'] = poll_ts
+REACTION_SEED_WORKERS = 8
+REACTION_SEED_RETRIES = 3
+# Reaction errors that retrying can't fix
+REACTION_SEED_FATAL_ERRORS = {'invalid_name', 'too_many_emoji', 'too_many_reactions', 'message_not_found', 'channel_not_found'}
+reaction_seed_pool = ThreadPoolExecutor(max_workers=REACTION_SEED_WORKERS, thread_name_prefix="reaction-seed")
 
-        stripped_emojis = [emoji.strip().strip(':') for emoji in emojis]
 
-        for emoji in stripped_emojis:
-            try:
-                app.client.reactions_add(
-                    channel=channel_id,
-                    name=emoji,
-                    timestamp=poll_ts
-                )
-            except Exception as e:
-                logger.info(f"Failed to add reaction '{emoji}': {e}")
-
-        poll_data.update({
-            'options': options,
-            'emojis': stripped_emojis,
-            'results': poll_results,
-            'max_mentions': max_mentions,
-            'start_time': time.time(),
-            'duration': duration,
-            'option_count': option_count,
-        })
-
-        polls[poll_id] = poll_data
-        save_polls_to_file(polls)
-        logger.info(f"create poll {polls}")
+def seed_reaction(channel_id, poll_ts, emoji):
+    error = None
+    for attempt in range(REACTION_SEED_RETRIES):
+        try:
+            slack_call(
+                'reactions_add',
+                channel=channel_id,
+                name=emoji,
+                timestamp=poll_ts
+            )
+            return True
+        except SlackApiError as e:
+            error = e
+            if e.response.get('error') == 'already_reacted':
+                return True
+            # slack_call has already waited out and retried rate limits, so a 429 here is final too
+            if e.response.status_code == 429 or e.response.get('error') in REACTION_SEED_FATAL_ERRORS:
+                break
+        except Exception as e:
+            error = e
+        if attempt < REACTION_SEED_RETRIES - 1:
+            time.sleep(0.5 * 2 ** attempt)
 
-    while True:
-        if not polls.get(poll_id, None):
-            break
+    logger.info(f"Failed to add reaction '{emoji}': {error}", extra={'channel_id': channel_id, 'message_ts': poll_ts})
+    return False
 
-        update_poll_results(channel_id, poll_id, polls)
-        time.sleep(10)
 
-        elapsed_time = time.time() - poll_data['start_time']
-        if elapsed_time >= duration * 3600 and duration > 0:
-            cleanup_poll(polls, poll_id, channel_id)
-            break
+def build_poll_creation_messages(poll_id, question, options, emojis):
+    # Create the message with question and poll ID
+    poll_info_message = f"Poll ID: {poll_id}\nQuestion: {question}\n"
+    poll_message = f"*{question}*\n"
+    for option, emoji in zip(options, emojis):
+        poll_message += f":{emoji.strip()}:{option.strip()}\n"
+    return poll_info_message, poll_message
 
-    save_polls_to_file(polls)
 
+def register_poll(polls, poll_id, channel_id, poll_ts, question, options, emojis, duration, max_mentions, option_count):
+    stripped_emojis = [emoji.strip().strip(':') for emoji in emojis]
+    poll_options = [PollOption(option.strip(), emoji) for option, emoji in zip(options, stripped_emojis)]
+    poll = Poll(poll_id, channel_id, poll_ts, poll_options, max_mentions, time.time(), duration, option_count,
+                question=question)
 
-def cleanup_poll(polls, poll_id, channel_id):
-    poll, max_mentions, options, stripped_emojis, poll_results = process_poll(polls, poll_id, channel_id)
-
-    result_message = f"Final Poll Results:\n"
-    if int(polls[poll_id]['option_count']) == 1:
-        data = poll_results
+    if leases.enabled:
+        poll_store.save_poll(poll, leases.worker_id, leases.ttl)
+        leases.adopt(poll_id)
+    else:
+        poll_store.save_poll(poll)
+    polls.add(poll)
+    logger.info("Poll registered", extra={'poll_id': poll_id, 'channel_id': channel_id, 'message_ts': poll_ts,
+                                          'options': len(poll.options), 'duration': duration})
+    return poll
+
+
+def post_poll(channel_id, question, options, emojis, duration, max_mentions, option_count, polls):
+    poll_id = poll_store.allocate_poll_id()
+    poll_info_message, poll_message = build_poll_creation_messages(poll_id, question, options, emojis)
+
+    # Send the poll info message first
+    slack_call(
+        'chat_postMessage',
+        channel=channel_id,
+        text=poll_info_message
+    )
 
-        user_set = set()  # To keep track of unique users
+    # Then send the poll message
+    result = slack_call(
+        'chat_postMessage',
+        channel=channel_id,
+        text=poll_message
+    )
 
-        for key, value in data.items():
-            if value['users']:
-                # Split users by comma and strip whitespace
-                users = [user.strip() for user in value['users'].split(',')]
-                # Add new users to the set
-                unique_users = [user for user in users if user not in user_set]
-                # Update the set with the new unique users
-                user_set.update(unique_users)
-                value['users'] = ', '.join(unique_users)
+    # Register before seeding so members reacting while the bot's own reactions land are already routed
+    return register_poll(polls, poll_id, channel_id, result['ts'], question, options, emojis, duration, max_mentions,
+                         option_count)
 
-        poll_results = data
 
-    for option, emoji in zip(options, stripped_emojis):
+def create_polls(specs, polls):
+    # Posts a batch of polls (the rate limiter spaces the chat_postMessage calls), seeds every poll's reactions on
+    # one pool, then hands the whole batch to the scheduler at once. Each poll's creation time runs from its own
+    # post to its last reaction landing.
+    created = []
+    started = {}
+    for spec in specs:
+        post_start = time.perf_counter()
         try:
-            user_mentions = poll_results[emoji]['users'].split(",")
-            count = poll_results[emoji]['count']
-        except KeyError:
-            user_mentions = ''
-        if user_mentions == '':
-            count = 0
-        user_mentions = str(user_mentions).replace("]", "").replace("[", "").replace("'", "")
-        result_message += f":{emoji}: {option.strip()}: {count} votes ({user_mentions})\n"
+            poll = post_poll(polls=polls, **spec)
+        except Exception as e:
+            logger.error(f"Error creating poll: {e}", extra={'question': spec['question']})
+            continue
+        created.append(poll)
+        started[poll.poll_id] = post_start
+
+    def seed(item):
+        poll, emoji = item
+        return seed_reaction(poll.channel_id, poll.timestamp, emoji), time.perf_counter()
+
+    seeds = [(poll, emoji) for poll in created for emoji in poll.emojis]
+    seeded = list(reaction_seed_pool.map(seed, seeds))
+    for poll in created:
+        poll_seeded = [result for (seed_poll, _), result in zip(seeds, seeded) if seed_poll is poll]
+        creation_time = max(finished for _, finished in poll_seeded) - started[poll.poll_id]
+        metrics.observe("poll_creation_seconds", creation_time)
+        logger.info(f"Poll created in {creation_time:.2f}s", extra={'poll_id': poll.poll_id, 'seconds': creation_time,
+                                                                    'reactions_seeded': sum(ok for ok, _ in poll_seeded),
+                                                                    'reactions': len(poll_seeded),
+                                                                    'batch': len(specs)})
+
+    scheduler.add_polls([(poll.poll_id, poll.start_time, poll.duration, None) for poll in created])
+    return [poll.poll_id for poll in created]
+
+
+POLL_SPEC_FIELDS = ('channel_id', 'question', 'options', 'emojis', 'duration', 'max_mentions', 'option_count')
+MAX_TEMPLATE_SESSIONS = 14
+SCHEDULED_POST_PREFIX = "post-"
+
+
+def expand_poll_template(submission):
+    # One poll per recurring session, the i-th posted stagger_hours * i after the first; returns [(post_at, spec)]
+    base = {field: submission[field] for field in POLL_SPEC_FIELDS}
+    now = time.time()
+    expanded = []
+    for i, session in enumerate(submission['sessions'] or [None]):
+        question = f"{base['question']} ({session})" if session else base['question']
+        expanded.append((now + i * submission['stagger_hours'] * 3600, dict(base, question=question)))
+    return expanded
+
+
+def submit_polls(submission, polls):
+    due = []
+    for post_at, spec in expand_poll_template(submission):
+        if post_at <= time.time():
+            due.append(spec)
+        else:
+            # Later sessions wait in polls.db so a restart doesn't lose them
+            key = f"{SCHEDULED_POST_PREFIX}{poll_store.schedule_post(post_at, spec)}"
+            scheduler.add_job(key, post_at, post_scheduled_poll)
+    return create_polls(due, polls)
+
+
+def post_scheduled_poll(key):
+    scheduler.cancel(key)
+    spec = poll_store.take_scheduled_post(int(key[len(SCHEDULED_POST_PREFIX):]))
+    if spec is not None:
+        create_polls([spec], polls)
+
+
+@metrics.timed("poll_cleanup_seconds")
+def cleanup_poll(polls, poll_id, channel_id):
+    if not leases.begin_close(poll_id):
+        logger.info("Lease lost before closing, leaving it to the new owner", extra={'poll_id': poll_id})
+        return
+    # Unregistered before the final read so no reaction or refresh can render live results over the final ones;
+    # an update already in flight is waited out
+    poll = polls.remove(poll_id)
+    if poll is None:
+        return
+    update_sender.settle(poll_id)
+    poll_results = fetch_poll_reactions(poll, PRIORITY_HIGH)
+    if poll_results is None:
+        # Closing without any tally would post and archive zero votes; keep the poll and try again later
+        polls.add(poll)
+        # expire_poll and /endpoll have already cancelled the poll's jobs, so the retry is registered afresh
+        scheduler.add_job(poll_id, close_retry_at(poll_id), expire_poll)
+        logger.info("No reactions to close on, retrying", extra={'poll_id': poll_id})
+        return
+    if needs_voter_list(poll, poll_results):
+        sync_voter_list(poll, PRIORITY_HIGH)
+
+    result_message = build_final_message(poll, poll_results)
 
     try:
-        app.client.chat_update(
+        slack_call(
+            'chat_update',
+            PRIORITY_HIGH,
             channel=channel_id,
-            ts=poll['timestamp'],
+            ts=poll.timestamp,
             text=result_message
         )
     except Exception as e:
-        logger.info(f"Failed to update message: {e}")
+        logger.info(f"Failed to post final results: {e}", extra={'poll_id': poll_id})
+
+    retire_poll(poll)
 
-    polls.pop(poll_id, None)
-    save_polls_to_file(polls)
+
+# A close that can't read the reactions is retried after 30s, doubling up to 10 minutes
+CLOSE_RETRY_DELAY = 30
+CLOSE_RETRY_MAX = 600
+close_failures = Counter()
+
+
+def close_retry_at(poll_id):
+    close_failures[poll_id] += 1
+    return time.time() + min(CLOSE_RETRY_DELAY * 2 ** (close_failures[poll_id] - 1), CLOSE_RETRY_MAX)
+
+
+def retire_poll(poll, coalescer=update_coalescer, limiter=rate_limiter):
+    poll_id = poll.poll_id
+    close_failures.pop(poll_id, None)
+    leases.forget(poll_id)
+    coalescer.forget(poll_id)
+    render_cache.forget(poll_id)
+    voter_list_cache.forget(poll_id)
+    try:
+        poll_store.archive_poll(poll)
+    except sqlite3.Error as e:
+        logger.info(f"Failed to archive poll: {e}", extra={'poll_id': poll_id})
+        poll_store.delete_poll(poll_id)
+    logger.info("Poll retired", extra={'poll_id': poll_id, 'user_cache': user_directory.stats(),
+                                       'coalescer': coalescer.stats(), 'render_cache': render_cache.stats(),
+                                       'rate_limited': limiter.throttled})
+
+
+POLL_CREATION_VIEW = {
+    "type": "modal",
+    "callback_id": "poll_creation_view",
+    "title": {"type": "plain_text", "text": "Create a Poll"},
+    "blocks": [
+        {
+            "type": "input",
+            "block_id": "channel_select_block",
+            "element": {
+                "type": "conversations_select",
+                "action_id": "selected_channel",
+                "placeholder": {"type": "plain_text", "text": "Select a channel"},
+                "filter": {"include": ["public", "private"]}
+            },
+            "label": {"type": "plain_text", "text": "Channel"}
+        },
+        {
+            "type": "input",
+            "block_id": "question_block",
+            "label": {"type": "plain_text", "text": "Poll Question"},
+            "element": {"type": "plain_text_input", "action_id": "question"},
+        },
+        {
+            "type": "input",
+            "block_id": "options_block",
+            "label": {"type": "plain_text", "text": "Poll Options (comma-separated)"},
+            "element": {"type": "plain_text_input", "action_id": "options"},
+        },
+        {
+            "type": "input",
+            "block_id": "emojis_block",
+            "label": {"type": "plain_text", "text": "Emojis (comma-separated)"},
+            "element": {"type": "plain_text_input", "action_id": "emojis"},
+        },
+        {
+            "type": "input",
+            "block_id": "duration_block",
+            "label": {"type": "plain_text", "text": "Poll Duration (in hours)"},
+            "element": {"type": "plain_text_input", "action_id": "duration"},
+        },
+        {
+            "type": "input",
+            "block_id": "max_mentions_block",
+            "label": {"type": "plain_text", "text": "Max Mentions (number)"},
+            "element": {"type": "plain_text_input", "action_id": "max_mentions"},
+        },
+        {
+            "type": "input",
+            "block_id": "option_count_block",
+            "label": {"type": "plain_text", "text": "Option Count (1 or more)"},
+            "element": {"type": "plain_text_input", "action_id": "option_count"},
+        },
+        {
+            "type": "input",
+            "block_id": "sessions_block",
+            "optional": True,
+            "label": {"type": "plain_text", "text": "Recurring Sessions (comma-separated, one poll each)"},
+            "element": {"type": "plain_text_input", "action_id": "sessions",
+                        "placeholder": {"type": "plain_text", "text": "Mon 6pm, Wed 6pm, Sat 9am"}},
+        },
+        {
+            "type": "input",
+            "block_id": "stagger_block",
+            "optional": True,
+            "label": {"type": "plain_text", "text": "Hours Between Session Polls (0 posts them all now)"},
+            "element": {"type": "plain_text_input", "action_id": "stagger"},
+        },
+    ],
+    "submit": {"type": "plain_text", "text": "Create"},
+}
 
 
 @app.shortcut("create_poll")
 def open_create_poll_modal(ack, body, client):
     ack()
-    client.views_open(
+    slack_call(
+        'views_open',
+        PRIORITY_HIGH,
         trigger_id=body["trigger_id"],
-        view={
-            "type": "modal",
-            "callback_id": "poll_creation_view",
-            "title": {"type": "plain_text", "text": "Create a Poll"},
-            "blocks": [
-                {
-                    "type": "input",
-                    "block_id": "channel_select_block",
-                    "element": {
-                        "type": "conversations_select",
-                        "action_id": "selected_channel",
-                        "placeholder": {"type": "plain_text", "text": "Select a channel"},
-                        "filter": {"include": ["public", "private"]}
-                    },
-                    "label": {"type": "plain_text", "text": "Channel"}
-                },
-                {
-                    "type": "input",
-                    "block_id": "question_block",
-                    "label": {"type": "plain_text", "text": "Poll Question"},
-                    "element": {"type": "plain_text_input", "action_id": "question"},
-                },
-                {
-                    "type": "input",
-                    "block_id": "options_block",
-                    "label": {"type": "plain_text", "text": "Poll Options (comma-separated)"},
-                    "element": {"type": "plain_text_input", "action_id": "options"},
-                },
-                {
-                    "type": "input",
-                    "block_id": "emojis_block",
-                    "label": {"type": "plain_text", "text": "Emojis (comma-separated)"},
-                    "element": {"type": "plain_text_input", "action_id": "emojis"},
-                },
-                {
-                    "type": "input",
-                    "block_id": "duration_block",
-                    "label": {"type": "plain_text", "text": "Poll Duration (in hours)"},
-                    "element": {"type": "plain_text_input", "action_id": "duration"},
-                },
-                {
-                    "type": "input",
-                    "block_id": "max_mentions_block",
-                    "label": {"type": "plain_text", "text": "Max Mentions (number)"},
-                    "element": {"type": "plain_text_input", "action_id": "max_mentions"},
-                },
-                {
-                    "type": "input",
-                    "block_id": "option_count_block",
-                    "label": {"type": "plain_text", "text": "Option Count (1 or more)"},
-                    "element": {"type": "plain_text_input", "action_id": "option_count"},
-                },
-            ],
-            "submit": {"type": "plain_text", "text": "Create"},
-        }
+        view=POLL_CREATION_VIEW
     )
 
 
-@app.view("poll_creation_view")
-def handle_poll_submission(ack, body, view, logger):
-    ack()
+class InvalidSubmission(ValueError):
+    # Messages keyed by block_id, shown under the modal's fields through ack(response_action="errors")
+    def __init__(self, errors):
+        super().__init__("; ".join(errors.values()))
+        self.errors = errors
 
+
+def parse_number(values, block_id, action_id, cast, message, errors, default=None):
+    value = (values.get(block_id, {}).get(action_id, {}).get("value") or "").strip()
+    if not value and default is not None:
+        return default
     try:
-        selected_channel = view["state"]["values"]["channel_select_block"]["selected_channel"]["selected_conversation"]
-    except KeyError:
-        logger.error("Channel ID not found.")
-        return
+        return cast(value)
+    except ValueError:
+        errors[block_id] = message
+        return default
+
+
+def parse_poll_submission(view):
+    # Returns the submission as a dict of POLL_SPEC_FIELDS plus the template's sessions and stagger_hours,
+    # raises InvalidSubmission for bad input and KeyError for a malformed view
+    values = view["state"]["values"]
+    errors = {}
+    selected_channel = values["channel_select_block"]["selected_channel"]["selected_conversation"]
+    question = values["question_block"]["question"]["value"]
+    options = values["options_block"]["options"]["value"].split(',')
+    emojis = values["emojis_block"]["emojis"]["value"].split(',')
+    duration = parse_number(values, "duration_block", "duration", int, "Enter a whole number of hours.", errors)
+    max_mentions = parse_number(values, "max_mentions_block", "max_mentions", int, "Enter a whole number.", errors)
+    option_count = parse_number(values, "option_count_block", "option_count", int, "Enter a whole number.", errors)
+
+    # Template mode: optional and absent from older views
+    sessions_value = values.get("sessions_block", {}).get("sessions", {}).get("value") or ""
+    sessions = [session.strip() for session in sessions_value.split(',') if session.strip()]
+    stagger_hours = parse_number(values, "stagger_block", "stagger", float, "Enter a number of hours.", errors, default=0)
+
+    if len(options) != len(emojis):
+        errors["emojis_block"] = f"Give one emoji per option ({len(options)} options, {len(emojis)} emojis)."
+    if len(sessions) > MAX_TEMPLATE_SESSIONS:
+        errors["sessions_block"] = f"At most {MAX_TEMPLATE_SESSIONS} recurring sessions per submission."
+    if stagger_hours < 0:
+        errors["stagger_block"] = "Stagger can't be negative."
+    if errors:
+        raise InvalidSubmission(errors)
+    return {
+        'channel_id': selected_channel,
+        'question': question,
+        'options': options,
+        'emojis': emojis,
+        'duration': duration,
+        'max_mentions': max_mentions,
+        'option_count': option_count,
+        'sessions': sessions,
+        'stagger_hours': stagger_hours,
+    }
 
-    question = view["state"]["values"]["question_block"]["question"]["value"]
-    options = view["state"]["values"]["options_block"]["options"]["value"]
-    emojis = view["state"]["values"]["emojis_block"]["emojis"]["value"]
-    duration = view["state"]["values"]["duration_block"]["duration"]["value"]
-    max_mentions = view["state"]["values"]["max_mentions_block"]["max_mentions"]["value"]
-    option_count = view["state"]["values"]["option_count_block"]["option_count"]["value"]
 
+@app.view("poll_creation_view")
+def handle_poll_submission(ack, body, view, logger):
+    # Validate before acknowledging so bad input is shown in the modal instead of closing it
     try:
-        options = options.split(',')
-        emojis = emojis.split(',')
-        duration = int(duration)
-        max_mentions = int(max_mentions)
-        option_count = int(option_count)
-
-        if len(options) != len(emojis):
-            logger.error("Options and emojis count mismatch.")
-            return
-
-        p = Process(target=create_poll, args=(selected_channel, question, options, emojis, duration, max_mentions, option_count, polls))
-        p.start()
-        poll_id = len(polls)
+        submission = parse_poll_submission(view)
+    except InvalidSubmission as e:
+        ack(response_action="errors", errors=e.errors)
+        return
+    except KeyError as e:
+        ack()
+        logger.error(f"Missing field in poll submission: {e}")
+        return
+    ack()
 
-        poll_processes[poll_id] = p
-        save_poll_processes_to_file(poll_processes)
-        logger.info(f"Poll created: {question}")
+    try:
+        poll_ids = submit_polls(submission, polls)
+        logger.info(f"Poll created: {submission['question']}", extra={'poll_ids': poll_ids,
+                                                                       'sessions': len(submission['sessions'])})
 
     except Exception as e:
         logger.error(f"Error creating poll: {e}")
@@ -482,85 +2071,194 @@ def handle_endpoll(ack, body, say):
     poll_id_str = body['text'].strip()
     channel_id = body['channel_id']
     if not poll_id_str.isdigit():
-        app.client.chat_postEphemeral(channel=channel_id, user=body['user_id'], text="Please provide a valid poll ID.")
+        slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=body['user_id'], text="Please provide a valid poll ID.")
         return
     poll_id = int(poll_id_str)
     if is_valid_rq(say, polls, channel_id, body['user_id'], poll_id):
-        if poll_id in polls:
+        if poll_id in polls and not leases.owns(poll_id):
+            poll_store.request_end(poll_id)
+            slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=body['user_id'],
+                       text=f"Poll (ID: {poll_id}) will be ended in a few seconds.")
+        elif poll_id in polls:
+            was_scheduled = scheduler.cancel(poll_id)
             cleanup_poll(polls, poll_id, channel_id)
 
-            if poll_id in poll_processes:
-                process = poll_processes[poll_id]
-                process.terminate()
-                process.join()
-                del poll_processes[poll_id]
-                save_poll_processes_to_file(poll_processes)
-                app.client.chat_postEphemeral(channel=channel_id, user=body['user_id'], text=f"Poll (ID: {poll_id}) has been ended "
-                                                                                             f"successfully.")
+            if was_scheduled:
+                slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=body['user_id'], text=f"Poll (ID: {poll_id}) has been ended "
+                                                                                                               f"successfully.")
             else:
-                app.client.chat_postEphemeral(channel=channel_id, user=body['user_id'], text=f"Poll (ID: {poll_id}) is not running, but "
-                                                                                             f"has been deactivated.")
+                slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=body['user_id'], text=f"Poll (ID: {poll_id}) is not running, but "
+                                                                                                               f"has been deactivated.")
         else:
-            app.client.chat_postEphemeral(channel=channel_id, user=body['user_id'], text=f"No active poll found with ID: {poll_id}.")
+            slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=channel_id, user=body['user_id'], text=f"No active poll found with ID: {poll_id}.")
+
+ARCHIVE_REPLY_LIMIT = 40
+
+
+def signups_reply(rq_user_id, text):
+    user_id, since = parse_signups_query(text, rq_user_id)
+    # Anyone can look up their own history; looking up someone else's is for whitelisted members
+    if user_id != rq_user_id and perms.level(rq_user_id) is None:
+        return f":wompwomp2::wompwomp2: <@{rq_user_id}> you are not in the whitelist! :wompwomp2::wompwomp2:"
+    rows = PollArchive(poll_store.path).signups(user_id=user_id, since=since)
+    return format_signups(rows, user_id, since, ARCHIVE_REPLY_LIMIT)
+
+
+@app.command("/signups")
+def handle_signups(ack, body):
+    ack()
+    try:
+        text = signups_reply(body['user_id'], body.get('text', ''))
+    except (ValueError, sqlite3.Error) as e:
+        text = f"Couldn't read the poll archive: {e}"
+    slack_call('chat_postEphemeral', PRIORITY_HIGH, channel=body['channel_id'], user=body['user_id'], text=text)
+
 
 @app.event("reaction_added")
 def handle_reaction_added(ack, body):
     ack()
-    event = body['event']
-    channel_id = event['item']['channel']
-    poll_ts = event['item']['ts']
-
-    for poll_id, poll_data in polls.items():
-        if poll_data['timestamp'] == poll_ts:
-            update_poll_results(channel_id, poll_id, polls)
-            break
+    apply_reaction_event(body['event'], added=True)
 
 
 @app.event("reaction_removed")
 def handle_reaction_removed(ack, body):
     ack()
-    event = body['event']
-    channel_id = event['item']['channel']
-    poll_ts = event['item']['ts']
-
-    for poll_id, poll_data in polls.items():
-        if poll_data['timestamp'] == poll_ts:
-            update_poll_results(channel_id, poll_id, polls)
-            break
-
-
-def reload_active_polls():
-    for poll_id, poll_data in polls.items():
-        if poll_data['active']:
-            p = Process(target=create_poll, args=(
-                poll_data['channel_id'],
-                "",
-                poll_data['options'],
-                poll_data['emojis'],
-                poll_data['duration'],
-                poll_data['max_mentions'],
-                poll_data['option_count'],
-                polls,
-                poll_id
-            ))
-            p.start()
-            poll_processes[poll_id] = p
-
-    save_poll_processes_to_file(poll_processes)
+    apply_reaction_event(body['event'], added=False)
 
 
-if __name__ == "__main__":
-    print(guh)
-    with open(POLL_PERMS, 'r') as file:
+def runs_bot(argv):
+    # The old runtime's poll processes were forked from `python main.py`, so they carry its argv
+    script = next((arg for arg in argv[1:] if not arg.startswith(b'-')), b'')
+    return os.path.basename(argv[0]).startswith(b'python') and os.path.basename(script) == b'main.py'
+
+
+def process_started_at(pid):
+    # Field 22 of /proc/<pid>/stat is the start time in clock ticks after boot; comm (field 2) may contain spaces
+    with open(f"/proc/{pid}/stat", 'rb') as file:
+        fields = file.read().rsplit(b')', 1)[1].split()
+    with open("/proc/stat", 'rb') as file:
+        boot_time = next(int(line.split()[1]) for line in file if line.startswith(b'btime '))
+    return boot_time + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+
+
+def cleanup_orphaned_processes():
+    # poll_processes.json holds the PIDs of the old process-per-poll runtime, which can outlive the bot that forked them
+    if not os.path.exists(POLL_PROCESSES_FILE):
+        return
+    written_at = os.stat(POLL_PROCESSES_FILE).st_mtime
+    with open(POLL_PROCESSES_FILE, 'r') as file:
+        try:
+            pids = json.load(file)
+        except json.JSONDecodeError:
+            pids = {}
+
+    for poll_id, pid in pids.items():
+        if pid == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as file:
+                argv = file.read().split(b'\0')
+            started_at = process_started_at(pid)
+        except OSError:
+            continue  # Already gone
+        # A PID reused by anything else (an editor on main.py, async_main.py, a process started after the file was
+        # written, e.g. another worker starting alongside this one) is left alone
+        if not runs_bot(argv) or started_at >= written_at:
+            continue
         try:
-            perms = json.load(file)
-        except json.JSONDecodeError as e:
-            logger.info(f"Failed to load permissions: {e}")
+            os.kill(pid, signal.SIGTERM)
+            logger.info(f"Terminated orphaned poll process {pid}", extra={'poll_id': poll_id})
+        except OSError as e:
+            logger.info(f"Failed to terminate orphaned poll process {pid}: {e}")
 
-    manager = Manager()
-    polls = manager.dict(load_polls_from_file())
-    poll_processes = {}
+    with open(POLL_PROCESSES_FILE, 'w') as file:
+        json.dump({}, file)
+
+
+def resync_poll(poll_id):
+    # Another worker received reactions for this poll, so this worker's tally missed them
+    poll = polls.get(poll_id, None)
+    if poll:
+        fetch_poll_reactions(poll, PRIORITY_REFRESH)
+        request_poll_update(poll_id, PRIORITY_REFRESH)
+
+
+def apply_lease_changes(changes, scheduler=scheduler, coalescer=update_coalescer, resync_job=resync_poll,
+                        expire_job=expire_poll, post_job=post_scheduled_poll):
+    acquired, lost, resync, end, posts = changes
+    now = time.time()
+    # The tally of a poll another worker owned (or owns now) missed that worker's events, so it is dropped and the
+    # next owner's first refresh re-reads the reactions
+    for poll_id in lost | acquired:
+        poll = polls.get(poll_id, None)
+        if poll:
+            poll.tally = None
+    for poll_id in lost:
+        scheduler.cancel(poll_id)
+        coalescer.forget(poll_id)
+        render_cache.forget(poll_id)
+    if acquired:
+        logger.info(f"Acquired {len(acquired)} poll leases", extra={'poll_ids': sorted(acquired)})
+    # Taken-over polls' first refreshes are spread over one tick
+    scheduler.add_polls([(poll.poll_id, poll.start_time, poll.duration, now + random.uniform(0, LEASE_INTERVAL))
+                         for poll in (polls.get(poll_id) for poll_id in acquired) if poll and poll.active])
+    for poll_id in resync:
+        scheduler.schedule(poll_id, now, resync_job)
+    for poll_id in end:
+        scheduler.schedule(poll_id, now, expire_job)
+    # Posts scheduled by another worker; whichever worker claims one first creates it
+    for post_id, post_at in posts:
+        key = f"{SCHEDULED_POST_PREFIX}{post_id}"
+        if not scheduler.is_scheduled(key):
+            scheduler.add_job(key, post_at, post_job)
+
+
+def run_leases():
+    while True:
+        try:
+            apply_lease_changes(leases.tick(polls))
+            rate_limiter.set_workers(leases.workers)
+        except Exception as e:
+            logger.info(f"Lease sync failed: {e}")
+        time.sleep(LEASE_INTERVAL)
+
+
+def reload_active_polls(scheduler=scheduler):
+    # Only the schedule is restored here. Each poll's first refresh (and with it the reactions_get that rebuilds its
+    # tally) is spread over STARTUP_RECONCILE_WINDOW so a deploy doesn't fire every poll's API calls at once;
+    # a reaction on a poll that hasn't been reconciled yet pulls its reconcile forward.
+    now = time.time()
+    scheduler.add_polls([(poll.poll_id, poll.start_time, poll.duration, now + random.uniform(0, STARTUP_RECONCILE_WINDOW))
+                         for poll in polls.values() if poll.active and leases.owns(poll.poll_id)])
+
+
+def reload_scheduled_posts(scheduler=scheduler, job=post_scheduled_poll):
+    for post_id, post_at in poll_store.load_scheduled_posts():
+        scheduler.add_job(f"{SCHEDULED_POST_PREFIX}{post_id}", post_at, job)
+
+
+if __name__ == "__main__":
+    print(guh)
+    startup_start = time.perf_counter()
+    start_metrics_server()
+    cleanup_orphaned_processes()
+    perms.start()
+
+    poll_store = PollStore()
+    poll_store.migrate_from_file()
+    polls = PollState(poll_store.load_polls())
+    user_directory.warm()
     reload_active_polls()
+    reload_scheduled_posts()
+    if RECONCILE_MODE == "channel":
+        scheduler.add_job(RECONCILE_SWEEP, time.time() + RECONCILE_INTERVAL, reconcile_all_polls)
+    if leases.enabled:
+        threading.Thread(target=run_leases, name="poll-leases", daemon=True).start()
+    scheduler.start()
+    update_sender.start()
 
     handler = SocketModeHandler(app, os.getenv("SLACK_APP_TOKEN"))
-    handler.start()
\ No newline at end of file
+    handler.connect()
+    logger.info(f"Ready in {time.perf_counter() - startup_start:.2f}s with {len(polls)} active polls",
+                extra={'active_polls': len(polls)})
+    threading.Event().wait()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# Finished polls and their counted votes, kept in polls.db next to the live polls table.
+# archived_votes is keyed by poll and indexed by user, archived_polls by channel and end time, so
+# "what did member X sign up for this season" reads a few index pages however large the archive grows.
+ARCHIVE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS archived_polls (poll_id INTEGER PRIMARY KEY, channel_id TEXT NOT NULL, "
+    "message_ts TEXT NOT NULL, question TEXT NOT NULL, options TEXT NOT NULL, max_mentions INTEGER NOT NULL, "
+    "start_time REAL NOT NULL, end_time REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS archived_polls_channel ON archived_polls (channel_id, end_time)",
+    "CREATE INDEX IF NOT EXISTS archived_polls_end ON archived_polls (end_time)",
+    "CREATE TABLE IF NOT EXISTS archived_votes (poll_id INTEGER NOT NULL, emoji TEXT NOT NULL, user_id TEXT NOT NULL, "
+    "option TEXT NOT NULL, rank INTEGER NOT NULL, PRIMARY KEY (poll_id, emoji, user_id))",
+    "CREATE INDEX IF NOT EXISTS archived_votes_user ON archived_votes (user_id, poll_id)",
+)
+EXPORT_FIELDS = ('poll_id', 'channel_id', 'question', 'start', 'end', 'user_id', 'option', 'emoji', 'rank', 'waitlisted')
+MENTION_RE = re.compile(r"<@([A-Z0-9]+)(?:\|[^>]*)?>")
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def create_archive_tables(conn):
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+
+
+def insert_archived_poll(conn, poll, end_time):
+    # Runs inside the caller's transaction so a poll is never both live and archived, or neither
+    names = {option.emoji: option.name for option in poll.options}
+    conn.execute(
+        "INSERT OR REPLACE INTO archived_polls (poll_id, channel_id, message_ts, question, options, max_mentions, "
+        "start_time, end_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (poll.poll_id, poll.channel_id, poll.timestamp, poll.question,
+         json.dumps([[option.name, option.emoji] for option in poll.options]), poll.max_mentions, poll.start_time,
+         end_time)
+    )
+    conn.execute("DELETE FROM archived_votes WHERE poll_id = ?", (poll.poll_id,))
+    if poll.tally is not None:
+        conn.executemany(
+            "INSERT INTO archived_votes (poll_id, emoji, user_id, option, rank) VALUES (?, ?, ?, ?, ?)",
+            ((poll.poll_id, emoji, user, names[emoji], rank) for emoji, rank, user in poll.tally.voters())
+        )
+
+
+def season_start():
+    # ARCHIVE_SEASON_START=YYYY-MM-DD, otherwise January 1st (kickoff is in January)
+    configured = os.getenv("ARCHIVE_SEASON_START")
+    if configured:
+        return parse_date(configured)
+    return datetime(datetime.now().year, 1, 1).timestamp()
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").timestamp()
+
+
+def format_date(timestamp, fmt="%Y-%m-%d"):
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+
+class PollArchive:
+    # Read side of the archive. Each query opens its own read-only connection and yields rows as SQLite
+    # produces them, so a slash command or export never holds the bot's write lock or the whole archive.
+    def __init__(self, path):
+        self.path = path
+
+    def _rows(self, sql, params):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor:
+                yield dict(zip(columns, row))
+        finally:
+            conn.close()
+
+    def signups(self, user_id=None, channel_id=None, since=None, until=None):
+        clauses = []
+        params = []
+        if user_id is not None:
+            clauses.append("v.user_id = ?")
+            params.append(user_id)
+        if channel_id is not None:
+            clauses.append("p.channel_id = ?")
+            params.append(channel_id)
+        if since is not None:
+            clauses.append("p.end_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("p.end_time < ?")
+            params.append(until)
+        sql = ("SELECT p.poll_id, p.channel_id, p.question, p.start_time, p.end_time, p.max_mentions, "
+               "v.user_id, v.option, v.emoji, v.rank "
+               "FROM archived_polls p JOIN archived_votes v ON v.poll_id = p.poll_id")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY p.end_time, p.poll_id"
+        for row in self._rows(sql, params):
+            # Votes past max_mentions were counted but not named on the message
+            row['waitlisted'] = 0 <= row['max_mentions'] <= row['rank']
+            yield row
+
+
+def export_row(row):
+    return {
+        'poll_id': row['poll_id'],
+        'channel_id': row['channel_id'],
+        'question': row['question'],
+        'start': datetime.fromtimestamp(row['start_time']).isoformat(timespec='seconds'),
+        'end': datetime.fromtimestamp(row['end_time']).isoformat(timespec='seconds'),
+        'user_id': row['user_id'],
+        'option': row['option'],
+        'emoji': row['emoji'],
+        'rank': row['rank'],
+        'waitlisted': row['waitlisted'],
+    }
+
+
+def export(rows, fmt, out):
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(export_row(row))
+    else:
+        for row in rows:
+            out.write(json.dumps(export_row(row)) + "\n")
+
+
+def parse_signups_query(text, rq_user_id):
+    # "/signups [@member] [YYYY-MM-DD]": defaults to the caller and the start of the season
+    mention = MENTION_RE.search(text)
+    date = DATE_RE.search(text)
+    user_id = mention.group(1) if mention else rq_user_id
+    since = parse_date(date.group(0)) if date else season_start()
+    return user_id, since
+
+
+def format_signups(rows, user_id, since, limit):
+    lines = []
+    total = 0
+    for row in rows:
+        total += 1
+        if len(lines) < limit:
+            question = row['question'] or f"Poll {row['poll_id']}"
+            waitlist = " (waitlist)" if row['waitlisted'] else ""
+            lines.append(f"• {format_date(row['end_time'], '%b %d')}: {question}: {row['option']}{waitlist} "
+                         f"in <#{row['channel_id']}>")
+    header = f"*Signups for <@{user_id}> since {format_date(since)}* ({total})"
+    if not total:
+        return header + "\nNo archived signups."
+    if total > limit:
+        lines.append(f"...and {total - limit} more. Export the archive for the full list.")
+    return header + "\n" + "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream archived poll signups as CSV or JSON lines")
+    parser.add_argument("--db", default="polls.db")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--user", help="only this member's signups")
+    parser.add_argument("--channel", help="only polls posted in this channel")
+    parser.add_argument("--since", help="YYYY-MM-DD, defaults to the start of the season")
+    parser.add_argument("--until", help="YYYY-MM-DD (exclusive)")
+    parser.add_argument("--all", action="store_true", help="ignore --since and export every season")
+    parser.add_argument("-o", "--output", help="file to write, defaults to stdout")
+    args = parser.parse_args()
+
+    since = None if args.all else parse_date(args.since) if args.since else season_start()
+    until = parse_date(args.until) if args.until else None
+    rows = PollArchive(args.db).signups(args.user, args.channel, since, until)
+    start = time.perf_counter()
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            export(rows, args.format, out)
+    else:
+        export(rows, args.format, sys.stdout)
+    print(f"Exported in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import threading
+
+
+class PollOption:
+    __slots__ = ('name', 'emoji')
+
+    def __init__(self, name, emoji):
+        self.name = name
+        self.emoji = emoji
+
+
+class Poll:
+    __slots__ = ('poll_id', 'channel_id', 'timestamp', 'options', 'emojis', 'max_mentions', 'start_time', 'duration',
+                 'option_count', 'active', 'question', 'voters_ts', 'voters_link', 'tally')
+
+    def __init__(self, poll_id, channel_id, timestamp, options, max_mentions, start_time, duration, option_count,
+                 active=True, question="", voters_ts=None, voters_link=None):
+        self.poll_id = poll_id
+        self.channel_id = channel_id
+        self.timestamp = timestamp
+        self.options = tuple(options)
+        self.emojis = tuple(option.emoji for option in self.options)
+        self.max_mentions = int(max_mentions)
+        self.start_time = start_time
+        self.duration = duration
+        self.option_count = int(option_count)
+        self.active = active
+        self.question = question
+        # Thread reply listing every named voter, posted once an option has more names than the message shows
+        self.voters_ts = voters_ts
+        self.voters_link = voters_link
+        self.tally = None
+
+    @property
+    def single_choice(self):
+        return self.option_count == 1
+
+    @classmethod
+    def from_dict(cls, poll_id, data):
+        options = [PollOption(name.strip(), emoji) for name, emoji in zip(data['options'], data['emojis'])]
+        return cls(poll_id, data['channel_id'], data['timestamp'], options, data['max_mentions'], data['start_time'],
+                   data['duration'], data['option_count'], data.get('active', True), data.get('question', ""),
+                   data.get('voters_ts'), data.get('voters_link'))
+
+    def to_dict(self):
+        # Same shape as the old polls.json entries so stored rows stay readable by either version
+        return {
+            'active': self.active,
+            'channel_id': self.channel_id,
+            'timestamp': self.timestamp,
+            'options': [option.name for option in self.options],
+            'emojis': list(self.emojis),
+            'max_mentions': self.max_mentions,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'option_count': self.option_count,
+            'question': self.question,
+            'voters_ts': self.voters_ts,
+            'voters_link': self.voters_link,
+        }
+
+
+class PollState:
+    # Poll registry living in the same process as the handlers and scheduler. Replaces the Manager dict proxy,
+    # so a lookup is a dict hit and every field read is plain attribute access. Also keeps the
+    # (channel_id, message ts) index used to route reaction events.
+    def __init__(self, polls=()):
+        self.polls = {}
+        self.by_message = {}
+        self.lock = threading.Lock()
+        for poll in polls:
+            self.add(poll)
+
+    def add(self, poll):
+        with self.lock:
+            self.polls[poll.poll_id] = poll
+            self.by_message[(poll.channel_id, poll.timestamp)] = poll
+
+    def remove(self, poll_id):
+        with self.lock:
+            poll = self.polls.pop(poll_id, None)
+            if poll is not None:
+                self.by_message.pop((poll.channel_id, poll.timestamp), None)
+            return poll
+
+    def get(self, poll_id, default=None):
+        return self.polls.get(poll_id, default)
+
+    def find_by_message(self, channel_id, timestamp):
+        return self.by_message.get((channel_id, timestamp))
+
+    def values(self):
+        return list(self.polls.values())
+
+    def __contains__(self, poll_id):
+        return poll_id in self.polls
+
+    def __len__(self):
+        return len(self.polls)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+import bench
+
+bot = None
+
+
+def setUpModule():
+    global bot
+    # main.py talks to Slack at import time, so it is pointed at the offline fake from a scratch directory
+    os.chdir(tempfile.mkdtemp())
+    bench.start_fake_slack(int(os.getenv("TEST_FAKE_SLACK_PORT", 8799)))
+    import main
+    bot = main
+
+
+class PollTallyTest(unittest.TestCase):
+    def counts(self, tally):
+        return {emoji: count for emoji, (count, _, _) in tally.results(-1).items()}
+
+    def test_multiple_choice_counts_every_reaction(self):
+        tally = bot.PollTally(["a", "b"], 2)
+        self.assertTrue(tally.add("a", "U1"))
+        self.assertTrue(tally.add("b", "U1"))
+        self.assertFalse(tally.add("a", "U1"))
+        self.assertEqual(self.counts(tally), {"a": 1, "b": 1})
+        self.assertTrue(tally.remove("a", "U1"))
+        self.assertFalse(tally.remove("a", "U1"))
+        self.assertEqual(self.counts(tally), {"a": 0, "b": 1})
+
+    def test_single_choice_counts_first_reaction(self):
+        tally = bot.PollTally(["a", "b"], 1)
+        self.assertTrue(tally.add("b", "U1"))
+        self.assertFalse(tally.add("a", "U1"))
+        self.assertEqual(self.counts(tally), {"a": 0, "b": 1})
+        # Removing the counted reaction moves the vote to the one held back
+        self.assertTrue(tally.remove("b", "U1"))
+        self.assertEqual(self.counts(tally), {"a": 1, "b": 0})
+        self.assertFalse(tally.remove("b", "U1"))
+
+    def test_reset_keeps_single_choice_votes_from_events(self):
+        tally = bot.PollTally(["a", "b"], 1)
+        tally.add("b", "U1")
+        tally.add("a", "U1")
+        tally.reset({"a": ["U1", "U2"], "b": ["U1", "U2"]})
+        self.assertEqual(tally.named(-1), {"a": ("U2",), "b": ("U1",)})
+        # Once the counted reaction is gone the vote falls back to the remaining one
+        tally.reset({"a": ["U1", "U2"]})
+        self.assertEqual(tally.named(-1), {"a": ("U1", "U2"), "b": ()})
+
+    def test_reset_keeps_known_voters_of_partial_reactions(self):
+        tally = bot.PollTally(["a"], 2)
+        tally.add("a", "U1")
+        tally.reset({"a": ["U2"]}, partial={"a"})
+        self.assertEqual(tally.named(-1), {"a": ("U1", "U2")})
+        tally.reset({"a": ["U2"]})
+        self.assertEqual(tally.named(-1), {"a": ("U2",)})
+
+
+class UserDirectoryTest(unittest.TestCase):
+    def test_bots_and_deactivated_members_dont_vote(self):
+        directory = bot.UserDirectory()
+        expires_at = bot.time.time() + 60
+        directory._put({'id': "U1"}, expires_at)
+        directory._put({'id': "U2", 'is_bot': True}, expires_at)
+        directory._put({'id': "U3", 'deleted': True}, expires_at)
+        directory.warmed_at = bot.time.time()
+        self.assertEqual([user for user in ("U1", "U2", "U3", "U4", bot.BOT_USER_ID) if directory.is_voter(user)],
+                         ["U1", "U4"])
+
+
+if __name__ == "__main__":
+    unittest.main()